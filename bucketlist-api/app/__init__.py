@@ -1,13 +1,29 @@
 """Module contains function to initialise the bucketlist app"""
 from flask_api import FlaskAPI
-from flask_sqlalchemy import SQLAlchemy
 from instance.config import app_config
 from flasgger import Swagger
 from flask_cors import CORS
+from .compression import Compress
+from .database import SQLAlchemy
+from .hashing import PasswordHasher
+from .metrics.instruments import RequestMetrics
+from .profiling import QueryProfiler
+from .renderers import JSONRenderer
+from .revocation import RevocationCache
+from .routing import ReplicaRouter
+from .token_cache import TokenCache
 
 
 db = SQLAlchemy()
 swagger = Swagger()
+revocations = RevocationCache()
+token_cache = TokenCache()
+password_hasher = PasswordHasher()
+compress = Compress()
+renderer = JSONRenderer()
+replicas = ReplicaRouter()
+profiler = QueryProfiler()
+request_metrics = RequestMetrics()
 
 
 def create_app(config_name):
@@ -18,8 +34,15 @@ def create_app(config_name):
     app.config.from_pyfile('config.py')
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    renderer.init_app(app)
     db.init_app(app)
+    replicas.init_app(app)
+    profiler.init_app(app)
     swagger.init_app(app)
+    revocations.init_app(app)
+    token_cache.init_app(app)
+    password_hasher.init_app(app)
+    compress.init_app(app)
     CORS(app)
 
     # registering blueprints
@@ -27,5 +50,11 @@ def create_app(config_name):
     from .bucketlist import bucketlist_blueprint
     app.register_blueprint(auth_blueprint, url_prefix='/v1/auth')
     app.register_blueprint(bucketlist_blueprint, url_prefix='/v1/bucketlists')
+    if app.config.get('METRICS_ENABLED'):
+        if not app.config.get('METRICS_TOKEN'):
+            raise ValueError('METRICS_ENABLED requires a METRICS_TOKEN')
+        from .metrics import metrics_blueprint
+        request_metrics.init_app(app)
+        app.register_blueprint(metrics_blueprint)
 
     return app
@@ -1,7 +1,10 @@
 """Module contains all the views for the auth blueprint """
-from flask import make_response, jsonify, request
-from flask_bcrypt import Bcrypt
+import datetime
+from flask import make_response, request
+from app import token_cache, password_hasher
+from app.hashing import HasherBusy
 from app.models import User, BlacklistToken
+from app.renderers import jsonify
 from app.utils import auth_required, validate_fields
 from . import auth_blueprint
 
@@ -82,6 +85,8 @@ def register_user():
                 'status': 'Success'
             }
             return make_response(jsonify(response)), 201
+        except HasherBusy:
+            raise
         except Exception as e:
             response = {
                 'status': 'Failed!!',
@@ -128,6 +133,10 @@ def login_user():
     user = User.query.filter_by(username=request.data['username']).first()
 
     if user and user.password_is_valid(request.data['password']):
+        try:
+            user.rehash_password(request.data['password'])
+        except HasherBusy:
+            pass
         auth_token = user.encode_auth_token(user.id)
         if auth_token:
             response = {
@@ -180,8 +189,8 @@ def reset_password():
     user = User.query.filter_by(username=request.data['username']).first()
 
     if user and user.password_is_valid(request.data['old_password']):
-        user.password = Bcrypt().generate_password_hash(
-            password=request.data['new_password']).decode()
+        user.password = password_hasher.generate(
+            request.data['new_password'])
         user.save()
         response = {
             'message': 'Successfully changed password',
@@ -214,9 +223,12 @@ def logout_user(user):
         401:
             description: "Failed"
     """
-    blacklist_token = BlacklistToken(token=user['auth_token'])
+    blacklist_token = BlacklistToken(
+        jti=user['token_id'],
+        expires_at=datetime.datetime.utcfromtimestamp(user['token_expires']))
     try:
         blacklist_token.save()
+        token_cache.invalidate(user['auth_token'])
         response = {
             'message': "Successfully logged out",
             'status': "Success"
@@ -1,11 +1,41 @@
 """views for bucketlist_blueprint """
 import datetime
-from flask import make_response, jsonify, request
-from app.utils import auth_required, validate_fields
-from app.models import Bucketlist, Item
+from flask import (
+    make_response, request, current_app, g, Response, stream_with_context)
+from werkzeug.wsgi import get_input_stream
+from app import db
+from app.utils import (
+    auth_required, validate_fields, cursor_requested, cursor_position,
+    keyset_page, listing_response,
+    conditional, sparse_fieldsets, validate_paging)
+from app.models import Bucketlist, Item, name_contains
+from app.renderers import jsonify, dumps
+from app.transfer import import_ndjson, export_bucketlists, EXPORT_FORMATS
 from . import bucketlist_blueprint
 
 
+def bucketlists_validator(user):
+    """
+    Validator of the bucketlists of a user. It has no modification date
+    since deleting a bucketlist would not move it forward
+    """
+    return (user['user_id'],) + tuple(
+        Bucketlist.listing_state(user['user_id'])), None
+
+
+def bucketlist_validator(user, b_id, **kwargs):
+    """Validator of a bucketlist and its items, None when it is missing"""
+    state = db.session.query(
+        Bucketlist.version,
+        Bucketlist.date_modified,
+        Bucketlist.date_created
+    ).filter_by(id=b_id).first()
+    if state is None:
+        return None
+    version, date_modified, date_created = state
+    return (b_id, version), date_modified or date_created
+
+
 @bucketlist_blueprint.route('', methods=['POST'])
 @auth_required
 @validate_fields('name', 'description')
@@ -58,6 +88,9 @@ def create_bucketlist(user):
 
 @bucketlist_blueprint.route('', methods=['GET'])
 @auth_required
+@validate_paging
+@sparse_fieldsets
+@conditional(bucketlists_validator)
 def get_bucketlists(user):
     """Retrieve bucketlists
     ---
@@ -82,6 +115,22 @@ def get_bucketlists(user):
            type: "string"
           description:
            type: "string"
+      - in: "query"
+        name: "view"
+        description: "summary returns only the id, name, item_count and
+          last_item_at of every bucketlist"
+        type: string
+        enum:
+         - "summary"
+      - in: "query"
+        name: "fields"
+        description: "Comma separated fields of the bucketlists to return,
+          items are only loaded when listed"
+        type: string
+      - in: "query"
+        name: "items_fields"
+        description: "Comma separated fields of the items to return"
+        type: string
     responses:
         400:
             description: "Failed"
@@ -91,15 +140,46 @@ def get_bucketlists(user):
     query = request.args.get('q')
     limit = request.args.get('limit')
     page = request.args.get('page')
+    fields, items_fields = g.fieldsets
 
+    def render(bucketlist):
+        """Returns a bucketlist with the requested fields"""
+        return bucketlist.to_json(fields, items_fields)
+
+    if request.args.get('view') == 'summary':
+        return get_bucketlist_summaries(user['user_id'], limit)
+    if cursor_requested():
+        position = cursor_position()
+        if position is None:
+            response = {
+                'status': 'Failed',
+                'message': 'Invalid cursor'
+            }
+            return make_response(jsonify(response)), 400
+        user_bucketlists = Bucketlist.query.options(
+            *Bucketlist.fields_loader(fields, items_fields)
+        ).filter(Bucketlist.owner == user['user_id'])
+        if query:
+            user_bucketlists = user_bucketlists.filter(
+                name_contains(Bucketlist.name, query))
+        bucketlists, next_cursor = keyset_page(
+            user_bucketlists, Bucketlist.id, position, limit)
+        response = {
+            'items': [render(bucketlist) for bucketlist in bucketlists],
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None
+        }
+        return make_response(jsonify(response)), 200
     if query and limit and page:
-        user_bucketlists = Bucketlist.query.filter(
-            Bucketlist.name.ilike("%" + query + "%"),
+        user_bucketlists = Bucketlist.query.options(
+            *Bucketlist.fields_loader(fields, items_fields)
+        ).filter(
+            name_contains(Bucketlist.name, query),
             Bucketlist.owner == user['user_id']
-        ).paginate(int(page), int(limit), False)
+        ).order_by(Bucketlist.id).paginate(int(page), int(limit), False)
         response = {
             'items': [
-                bucketlist.to_json() for bucketlist in user_bucketlists.items
+                render(bucketlist) for bucketlist in user_bucketlists.items
                 ],
             'pages': user_bucketlists.pages,
             'next_page': user_bucketlists.next_num,
@@ -110,11 +190,12 @@ def get_bucketlists(user):
         }
         return make_response(jsonify(response)), 200
     if limit and page:
-        user_bucketlists = Bucketlist.query.filter_by(
-            owner=user['user_id']).paginate(int(page), int(limit), False)
+        user_bucketlists = Bucketlist.get_all_bucketlists(
+            user['user_id'], fields, items_fields
+        ).paginate(int(page), int(limit), False)
         response = {
             'items': [
-                bucketlist.to_json() for bucketlist in user_bucketlists.items
+                render(bucketlist) for bucketlist in user_bucketlists.items
                 ],
             'pages': user_bucketlists.pages,
             'next_page': user_bucketlists.next_num,
@@ -125,24 +206,158 @@ def get_bucketlists(user):
         }
         return make_response(jsonify(response)), 200
     if limit:
-        user_bucketlists = Bucketlist.query.filter_by(
-            owner=user['user_id']).limit(int(limit))
-        response = [bucketlist.to_json() for bucketlist in user_bucketlists]
+        user_bucketlists = Bucketlist.get_all_bucketlists(
+            user['user_id'], fields, items_fields).limit(int(limit))
+        response = [render(bucketlist) for bucketlist in user_bucketlists]
         return make_response(jsonify(response)), 200
     if query:
-        user_bucketlists = Bucketlist.query.filter(
-            Bucketlist.name.ilike("%" + query + "%"),
+        user_bucketlists = Bucketlist.query.options(
+            *Bucketlist.fields_loader(fields, items_fields)
+        ).filter(
+            name_contains(Bucketlist.name, query),
             Bucketlist.owner == user['user_id']
-        ).all()
-        response = [bucketlist.to_json() for bucketlist in user_bucketlists]
+        ).order_by(Bucketlist.id).all()
+        response = [render(bucketlist) for bucketlist in user_bucketlists]
         return make_response(jsonify(response)), 200
-    user_bucketlists = Bucketlist.get_all_bucketlists(user['user_id'])
-    response = [bucketlist.to_json() for bucketlist in user_bucketlists]
+    return listing_response(
+        Bucketlist.query.options(
+            *Bucketlist.fields_loader(fields, items_fields)
+        ).filter_by(owner=user['user_id']),
+        Bucketlist.id,
+        render)
+
+
+def get_bucketlist_summaries(owner_id, limit):
+    """
+    Returns the id, name and item count of the bucketlists of a user
+    without loading any item, a page at a time with cursor. Searches,
+    numbered pages and sparse fieldsets are not supported
+    """
+    unsupported = [
+        name for name in ('q', 'page', 'fields', 'items_fields')
+        if name in request.args]
+    if unsupported:
+        response = {
+            'status': 'Failed',
+            'message': 'Not supported with view=summary: {}'.format(
+                ', '.join(unsupported))
+        }
+        return make_response(jsonify(response)), 400
+    summaries = Bucketlist.get_summaries(owner_id)
+    if cursor_requested():
+        position = cursor_position()
+        if position is None:
+            response = {
+                'status': 'Failed',
+                'message': 'Invalid cursor'
+            }
+            return make_response(jsonify(response)), 400
+        summaries, next_cursor = keyset_page(
+            summaries, Bucketlist.id, position, limit)
+        response = {
+            'items': [
+                Bucketlist.summary_to_json(summary)
+                for summary in summaries
+                ],
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None
+        }
+        return make_response(jsonify(response)), 200
+    if limit:
+        summaries = summaries.limit(int(limit))
+    response = [Bucketlist.summary_to_json(summary) for summary in summaries]
     return make_response(jsonify(response)), 200
 
 
+@bucketlist_blueprint.route('/import', methods=['POST'])
+@auth_required
+def import_bucketlists(user):
+    """Import bucketlists with their items
+    ---
+    tags:
+     - "bucketlists"
+    consumes:
+     - "application/x-ndjson"
+    produces:
+     - "application/x-ndjson"
+    parameters:
+      - in: "header"
+        name: "Authorization"
+        description: "Token of logged in user"
+        required: true
+        type: string
+      - in: "body"
+        name: "body"
+        description: "One bucketlist per line with name, description
+          and a list of items with name and description"
+        required: true
+        schema:
+         type: "string"
+    responses:
+        200:
+            description: "One line per failed bucketlist and the running
+              totals after every batch, ending with the final totals"
+     """
+    events = import_ndjson(
+        get_input_stream(request.environ),
+        user['user_id'],
+        current_app.config.get('IMPORT_BATCH_SIZE'),
+        current_app.config.get('ITEM_BATCH_LIMIT'))
+    lines = (dumps(event) + '\n' for event in events)
+    return Response(
+        stream_with_context(lines), mimetype='application/x-ndjson')
+
+
+@bucketlist_blueprint.route('/export', methods=['GET'])
+@auth_required
+def export_user_bucketlists(user):
+    """Export bucketlists with their items
+    ---
+    tags:
+     - "bucketlists"
+    produces:
+     - "application/x-ndjson"
+     - "text/csv"
+    parameters:
+      - in: "header"
+        name: "Authorization"
+        description: "Token of logged in user"
+        required: true
+        type: string
+      - in: "query"
+        name: "format"
+        description: "ndjson, one bucketlist per line, or csv, one item
+          per line"
+        type: string
+        enum:
+         - "ndjson"
+         - "csv"
+    responses:
+        400:
+            description: "Unknown format"
+        200:
+            description: "success"
+     """
+    export_format = request.args.get('format', 'ndjson')
+    if export_format not in EXPORT_FORMATS:
+        response = {
+            'status': 'Failed',
+            'message': 'Unknown format'
+        }
+        return make_response(jsonify(response)), 400
+    mimetype, lines = export_bucketlists(
+        user['user_id'], export_format,
+        current_app.config.get('EXPORT_CHUNK_SIZE'))
+    response = Response(stream_with_context(lines), mimetype=mimetype)
+    response.headers['Content-Disposition'] = \
+        'attachment; filename=bucketlists.{}'.format(export_format)
+    return response
+
+
 @bucketlist_blueprint.route('/<int:b_id>', methods=['GET'])
 @auth_required
+@sparse_fieldsets
+@conditional(bucketlist_validator)
 def get_bucketlist(user, b_id):
     """ Retrieve bucketlist
     ---
@@ -173,9 +388,12 @@ def get_bucketlist(user, b_id):
         200:
             description: "success"
      """
-    my_bucketlist = Bucketlist.query.filter_by(id=b_id).first()
+    fields, items_fields = g.fieldsets
+    my_bucketlist = Bucketlist.query.options(
+        *Bucketlist.fields_loader(fields, items_fields)
+    ).filter_by(id=b_id).first()
     if my_bucketlist:
-        response = my_bucketlist.to_json()
+        response = my_bucketlist.to_json(fields, items_fields)
         return make_response(jsonify(response)), 200
     response = {
         'status': 'Failed',
@@ -289,6 +507,7 @@ def edit_bucketlist(user, b_id):
         if my_bucketlist.description != description:
             my_bucketlist.description = description
         my_bucketlist.date_modified = datetime.datetime.utcnow()
+        my_bucketlist.version = Bucketlist.version + 1
         my_bucketlist.save()
         response = my_bucketlist.to_json()
         return make_response(jsonify(response)), 200
@@ -352,6 +571,7 @@ def create_bucketlist_item(user, b_id):
                     name=request.data['name'],
                     description=request.data['description'],
                     bucketlist_id=b_id)
+                Bucketlist.touch(b_id, 1)
                 new_item.save()
             except Exception as error:
                 response = {
@@ -380,8 +600,85 @@ def create_bucketlist_item(user, b_id):
     return make_response(jsonify(response)), 404
 
 
+@bucketlist_blueprint.route('/<int:b_id>/items/batch', methods=['POST'])
+@auth_required
+def create_bucketlist_items(user, b_id):
+    """Create many bucketlist items at once
+    ---
+    tags:
+     - "bucketlists"
+    parameters:
+     - in: "header"
+       name: "Authorization"
+       required: true
+       description: "Token of logged in user"
+       type: string
+     - in: "body"
+       name: "body"
+       required: true
+       description: "Names and Descriptions of bucketlist items"
+       schema:
+        type: "array"
+        items:
+         type: "object"
+         required:
+          - name
+          - description
+         properties:
+          name:
+             type: "string"
+          description:
+             type: "string"
+    responses:
+        404:
+            description: "resource not found"
+        400:
+            description: "Failed"
+        201:
+            description: "success, with the result of every item"
+    """
+    rows = request.data
+    if not isinstance(rows, list) or not rows or \
+            len(rows) > current_app.config.get('ITEM_BATCH_LIMIT'):
+        response = {
+            'status': 'Failed',
+            'message': 'Invalid payload'
+        }
+        return make_response(jsonify(response)), 400
+    my_bucketlist = Bucketlist.query.filter_by(id=b_id,
+                                               owner=user['user_id']
+                                               ).first()
+    if my_bucketlist:
+        try:
+            results = Item.bulk_create(b_id, rows)
+        except Exception as error:
+            db.session.rollback()
+            response = {
+                'status': 'Failed',
+                'message': str(error)
+            }
+            return make_response(jsonify(response)), 400
+        response = {
+            'status': 'Success',
+            'created': len([
+                result for result in results
+                if result['status'] == 'Success']),
+            'items': results
+        }
+        return make_response(jsonify(response)), 201
+    response = {
+        'status': 'Failed',
+        'message': 'Bucketlist not found',
+        'user': user['user_id']
+    }
+    return make_response(jsonify(response)), 404
+
+
 @bucketlist_blueprint.route('/<int:b_id>/items', methods=['GET'])
 @auth_required
+@validate_paging
+@sparse_fieldsets
+@conditional(bucketlist_validator)
 def get_bucketlist_item(user, b_id):
     """Retrieve bucketlists
     ---
@@ -415,59 +712,101 @@ def get_bucketlist_item(user, b_id):
     query = request.args.get('q')
     limit = request.args.get('limit')
     page = request.args.get('page')
-    bucketlist = Bucketlist.query.filter_by(id=b_id,
+    fields, items_fields = g.fieldsets
+    bucketlist_query = Bucketlist.query
+    if fields is not None or items_fields is not None:
+        # only the paginated listings render the bucketlist
+        bucketlist_query = bucketlist_query.options(
+            *Bucketlist.fields_loader(fields, items_fields))
+    bucketlist = bucketlist_query.filter_by(id=b_id,
                                             owner=user['user_id']
                                             ).first()
 
+    if cursor_requested():
+        position = cursor_position()
+        if position is None:
+            response = {
+                'status': 'Failed',
+                'message': 'Invalid cursor'
+            }
+            return make_response(jsonify(response)), 400
+        if not bucketlist:
+            response = {
+                'status': 'Failed',
+                'message': 'Bucketlist not found',
+                'user': user['user_id']
+            }
+            return make_response(jsonify(response)), 404
+        bucketlist_items = Item.query.options(
+            *Item.fields_loader(items_fields)
+        ).filter(Item.bucketlist_id == b_id)
+        if query:
+            bucketlist_items = bucketlist_items.filter(
+                name_contains(Item.name, query))
+        items, next_cursor = keyset_page(
+            bucketlist_items, Item.id, position, limit)
+        response = {
+            'items': [item.to_json(items_fields) for item in items],
+            'next_cursor': next_cursor,
+            'has_next': next_cursor is not None,
+            'bucketlist': bucketlist.to_json(fields, items_fields)
+        }
+        return make_response(jsonify(response)), 200
     if query and limit and page:
-        bucketlist_items = Item.query.filter(
-            Item.name.ilike("%" + query + "%"),
+        bucketlist_items = Item.query.options(
+            *Item.fields_loader(items_fields)
+        ).filter(
+            name_contains(Item.name, query),
             Item.bucketlist_id == b_id
-        ).paginate(int(page), int(limit), False)
+        ).order_by(Item.id).paginate(int(page), int(limit), False)
         response = {
             'items': [
-                item.to_json() for item in bucketlist_items.items
+                item.to_json(items_fields) for item in bucketlist_items.items
                 ],
             'pages': bucketlist_items.pages,
             'next_page': bucketlist_items.next_num,
             'current_page': bucketlist_items.page,
             'prev_page': bucketlist_items.prev_num,
-            'bucketlist': bucketlist.to_json(),
+            'bucketlist': bucketlist.to_json(fields, items_fields),
             'has_next': bucketlist_items.has_next,
             'has_prev': bucketlist_items.has_prev
         }
         return make_response(jsonify(response)), 200
     if limit and page:
-        bucketlist_items = Item.query.filter_by(
-            bucketlist_id=b_id).paginate(int(page), int(limit), False)
+        bucketlist_items = Item.get_all_items(b_id, items_fields).paginate(
+            int(page), int(limit), False)
         response = {
             'items': [
-                item.to_json() for item in bucketlist_items.items
+                item.to_json(items_fields) for item in bucketlist_items.items
                 ],
             'pages': bucketlist_items.pages,
             'next_page': bucketlist_items.next_num,
             'current_page': bucketlist_items.page,
             'prev_page': bucketlist_items.prev_num,
-            'bucketlist': bucketlist.to_json(),
+            'bucketlist': bucketlist.to_json(fields, items_fields),
             'has_next': bucketlist_items.has_next,
             'has_prev': bucketlist_items.has_prev
         }
         return make_response(jsonify(response)), 200
     if limit:
-        bucketlist_items = Item.query.filter_by(
-            bucketlist_id=b_id).limit(int(limit))
-        response = [item.to_json() for item in bucketlist_items]
+        bucketlist_items = Item.get_all_items(
+            b_id, items_fields).limit(int(limit))
+        response = [item.to_json(items_fields) for item in bucketlist_items]
         return make_response(jsonify(response)), 200
     if query:
-        bucketlist_items = Item.query.filter(
-            Item.name.ilike("%" + query + "%"),
+        bucketlist_items = Item.query.options(
+            *Item.fields_loader(items_fields)
+        ).filter(
+            name_contains(Item.name, query),
             Item.bucketlist_id == b_id
-        ).all()
-        response = [item.to_json() for item in bucketlist_items]
+        ).order_by(Item.id).all()
+        response = [item.to_json(items_fields) for item in bucketlist_items]
         return make_response(jsonify(response)), 200
-    bucketlist_items = Item.get_all_items(b_id)
-    response = [item.to_json() for item in bucketlist_items]
-    return make_response(jsonify(response)), 200
+    return listing_response(
+        Item.query.options(*Item.fields_loader(items_fields)).filter_by(
+            bucketlist_id=b_id),
+        Item.id,
+        lambda item: item.to_json(items_fields))
 
 
 @bucketlist_blueprint.route('/<int:b_id>/items/<int:i_id>', methods=['PUT'])
@@ -521,6 +860,7 @@ def edit_bucketlist_item(user, b_id, i_id):
                 return make_response(jsonify({'status': 'Failed'})), 409
         if my_item.description != description:
             my_item.description = request.data['description']
+        Bucketlist.touch(b_id)
         my_item.save()
         response = my_item.to_json()
         return make_response(jsonify(response)), 200
@@ -571,6 +911,7 @@ def delete_bucketlist_item(user, b_id, i_id):
 
     if my_item:
         if request.method == 'DELETE':
+            Bucketlist.touch(b_id, -1)
             my_item.delete()
             response = {
                 'status': 'Success',
@@ -0,0 +1,141 @@
+"""Module compresses responses with the encodings clients accept"""
+import zlib
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+class _GzipCompressor:
+    """Incremental gzip compressor"""
+
+    def __init__(self, level):
+        """Initialising the compressor"""
+        self.compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data, flush=False):
+        """Compresses data, flushing it to the output when asked to"""
+        compressed = self.compressor.compress(data)
+        if flush:
+            compressed += self.compressor.flush(zlib.Z_SYNC_FLUSH)
+        return compressed
+
+    def finish(self):
+        """Returns the end of the compressed stream"""
+        return self.compressor.flush()
+
+
+class _BrotliCompressor:
+    """Incremental brotli compressor"""
+
+    def __init__(self, level):
+        """Initialising the compressor"""
+        self.compressor = brotli.Compressor(quality=level)
+
+    def compress(self, data, flush=False):
+        """Compresses data, flushing it to the output when asked to"""
+        compressed = self.compressor.process(data)
+        if flush:
+            compressed += self.compressor.flush()
+        return compressed
+
+    def finish(self):
+        """Returns the end of the compressed stream"""
+        return self.compressor.finish()
+
+
+def _compressor(encoding):
+    """Returns a compressor for an encoding at the configured level"""
+    if encoding == 'br':
+        return _BrotliCompressor(current_app.config.get('COMPRESS_BR_LEVEL'))
+    return _GzipCompressor(current_app.config.get('COMPRESS_LEVEL'))
+
+
+def _compress_stream(app_iter, compressor, charset, flush_size=8192):
+    """
+    Yields the compressed chunks of a streamed body, flushed once about
+    flush_size bytes were compressed since the last flush, as every flush
+    costs ratio. The first chunk is flushed straight away to keep the
+    time to first byte low
+    """
+    try:
+        pending = 0
+        first = True
+        for chunk in app_iter:
+            if isinstance(chunk, str):
+                chunk = chunk.encode(charset)
+            pending += len(chunk)
+            flush = first or pending >= flush_size
+            compressed = compressor.compress(chunk, flush=flush)
+            if flush:
+                first = False
+                pending = 0
+            if compressed:
+                yield compressed
+        yield compressor.finish()
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+
+class Compress:
+    """
+    Compresses JSON, NDJSON and CSV responses with brotli, when it is
+    installed, or gzip as negotiated through Accept-Encoding
+    """
+
+    def __init__(self, app=None):
+        """Initialising the extension"""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Compresses the responses of the app"""
+        app.after_request(self.compress)
+
+    @staticmethod
+    def encoding():
+        """Returns the preferred encoding of the client, None for none"""
+        encodings = ['br', 'gzip'] if brotli is not None else ['gzip']
+        return request.accept_encodings.best_match(encodings)
+
+    def compress(self, response):
+        """Compresses a response the client accepts compressed"""
+        config = current_app.config
+        if not config.get('COMPRESS_ENABLED'):
+            return response
+        if response.mimetype not in config.get('COMPRESS_MIMETYPES'):
+            if response.status_code == 304 and self.encoding():
+                self.weaken_etag(response)
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = self.encoding()
+        if not encoding or 'Content-Encoding' in response.headers or \
+                not 200 <= response.status_code < 300:
+            return response
+        compressor = _compressor(encoding)
+        if response.is_streamed:
+            response.response = _compress_stream(
+                response.response, compressor, response.charset,
+                config.get('COMPRESS_STREAM_FLUSH_SIZE'))
+            response.headers.pop('Content-Length', None)
+        else:
+            data = response.get_data()
+            if len(data) < config.get('COMPRESS_MIN_SIZE'):
+                return response
+            response.set_data(compressor.compress(data) + compressor.finish())
+        response.headers['Content-Encoding'] = encoding
+        self.weaken_etag(response)
+        return response
+
+    @staticmethod
+    def weaken_etag(response):
+        """
+        Marks the ETag weak, the compressed body is not byte for byte the
+        representation the tag was computed for
+        """
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
@@ -0,0 +1,142 @@
+"""Module configures the database engine and its connection pool"""
+import logging
+import threading
+import time
+import flask_sqlalchemy
+from sqlalchemy import create_engine, orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+from .routing import RoutingSession
+
+logger = logging.getLogger(__name__)
+
+
+def pool_sizing(threads, workers=1, max_connections=0):
+    """
+    Returns the pool size and overflow of a worker process serving
+    threads requests at once, a connection per thread and as many again
+    in bursts. With max_connections the connections of all the workers
+    together stay within it
+    """
+    pool_size = max_overflow = max(threads, 1)
+    if max_connections:
+        budget = max(max_connections // max(workers, 1), 1)
+        pool_size = min(pool_size, budget)
+        max_overflow = min(max_overflow, budget - pool_size)
+    return pool_size, max_overflow
+
+
+class TimedQueuePool(QueuePool):
+    """Queue pool measuring how long checkouts wait for a connection"""
+
+    def __init__(self, creator, slow_checkout=None, **kw):
+        """
+        Initialising the pool, checkouts waiting longer than slow_checkout
+        seconds are logged
+        """
+        super().__init__(creator, **kw)
+        self.slow_checkout = slow_checkout
+        self.stats_lock = threading.Lock()
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def _do_get(self):
+        """Checks out a connection, recording the time it took"""
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - started
+            with self.stats_lock:
+                self.checkouts += 1
+                self.wait_total += waited
+                self.wait_max = max(self.wait_max, waited)
+            if self.slow_checkout is not None and \
+                    waited > self.slow_checkout:
+                logger.warning(
+                    'Waited %.1fms for a database connection, %s',
+                    waited * 1000, self.status())
+
+    def recreate(self):
+        """Returns a new pool with the same settings"""
+        pool = super().recreate()
+        pool.slow_checkout = self.slow_checkout
+        return pool
+
+    def wait_stats(self):
+        """Returns the number of checkouts and their waits in seconds"""
+        with self.stats_lock:
+            return {
+                'checkouts': self.checkouts,
+                'wait_total': self.wait_total,
+                'wait_max': self.wait_max
+            }
+
+
+class SQLAlchemy(flask_sqlalchemy.SQLAlchemy):
+    """
+    Flask-SQLAlchemy configuring PostgreSQL engines from the SQLALCHEMY_
+    pool settings, sizing the pool from the threads of the worker when
+    it is not set
+    """
+
+    def apply_driver_hacks(self, app, info, options):
+        """Adds the pool and connection options of PostgreSQL engines"""
+        super().apply_driver_hacks(app, info, options)
+        if not info.drivername.startswith('postgres'):
+            return
+        config = app.config
+        if config.get('SQLALCHEMY_PGBOUNCER'):
+            # PgBouncer pools the connections and rejects startup options
+            for option in ('pool_size', 'max_overflow', 'pool_timeout'):
+                options.pop(option, None)
+            options['poolclass'] = NullPool
+            return
+        pool_size, max_overflow = pool_sizing(
+            config.get('GUNICORN_THREADS'),
+            config.get('WEB_CONCURRENCY'),
+            config.get('DATABASE_MAX_CONNECTIONS'))
+        options.setdefault('pool_size', pool_size)
+        options.setdefault('max_overflow', max_overflow)
+        options.setdefault('pool_pre_ping', config.get(
+            'SQLALCHEMY_POOL_PRE_PING'))
+        options.setdefault('poolclass', TimedQueuePool)
+        if options['poolclass'] is TimedQueuePool and \
+                config.get('SQLALCHEMY_POOL_SLOW_CHECKOUT') is not None:
+            options['slow_checkout'] = \
+                config['SQLALCHEMY_POOL_SLOW_CHECKOUT'] / 1000
+        if config.get('SQLALCHEMY_STATEMENT_TIMEOUT'):
+            connect_args = options.setdefault('connect_args', {})
+            connect_args['options'] = '-c statement_timeout={}'.format(
+                config['SQLALCHEMY_STATEMENT_TIMEOUT'])
+
+    def create_session(self, options):
+        """Returns a factory of sessions routing reads to replicas"""
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def make_engine(self, app, uri):
+        """Returns an engine for uri configured like the primary one"""
+        info = make_url(uri)
+        options = {'convert_unicode': True}
+        self.apply_pool_defaults(app, options)
+        self.apply_driver_hacks(app, info, options)
+        return create_engine(info, **options)
+
+    def pool_stats(self, app=None):
+        """
+        Returns the connections of the pool of an app, with the checkout
+        waits when the pool measures them
+        """
+        pool = self.get_engine(app).pool
+        stats = {'pool': type(pool).__name__}
+        if isinstance(pool, QueuePool):
+            stats.update({
+                'size': pool.size(),
+                'checked_in': pool.checkedin(),
+                'checked_out': pool.checkedout(),
+                'overflow': pool.overflow()
+            })
+        if isinstance(pool, TimedQueuePool):
+            stats.update(pool.wait_stats())
+        return stats
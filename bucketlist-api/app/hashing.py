@@ -0,0 +1,136 @@
+"""Module runs password hashing on a bounded pool of threads"""
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import bcrypt
+from flask import current_app, make_response
+from flask_bcrypt import Bcrypt
+from .renderers import jsonify
+
+
+class HasherBusy(Exception):
+    """Raised when the hashing pool can not take more work"""
+
+
+def hash_rounds(pw_hash):
+    """Returns the cost a bcrypt hash was computed with"""
+    try:
+        return int(pw_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+def calibrate_rounds(target_ms, min_rounds=4, max_rounds=16, sample=8):
+    """
+    Returns the highest bcrypt cost hashing within target_ms on this
+    machine. The time of the sample cost is measured and doubled for
+    every extra round
+    """
+    timings = []
+    for _ in range(3):
+        started = time.perf_counter()
+        bcrypt.hashpw(b'calibration', bcrypt.gensalt(sample))
+        timings.append((time.perf_counter() - started) * 1000)
+    elapsed_ms = min(timings) / 2 ** (sample - min_rounds)
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed_ms * 2 <= target_ms:
+        rounds += 1
+        elapsed_ms *= 2
+    return rounds
+
+
+class _HasherState:
+    """The hashing pool of one application in one worker process"""
+
+    def __init__(self, app):
+        """Initialising the state from the app configuration"""
+        self.bcrypt = Bcrypt(app)
+        self.log_rounds = app.config.get('BCRYPT_LOG_ROUNDS')
+        self.pool_size = app.config.get('BCRYPT_POOL_SIZE')
+        self.queue_limit = app.config.get('BCRYPT_QUEUE_LIMIT')
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(
+            self.pool_size + self.queue_limit)
+        self.pending = 0
+        self.executor = None
+        self.pid = None
+
+    def get_executor(self):
+        """Returns the pool of this process, creating it after a fork"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.executor = ThreadPoolExecutor(
+                    max_workers=self.pool_size)
+            return self.executor
+
+    def run(self, func, *args):
+        """
+        Runs func on the pool and waits for its result. Raises HasherBusy
+        without queueing when the pool and its queue are full
+        """
+        if not self.slots.acquire(False):
+            raise HasherBusy()
+        with self.lock:
+            self.pending += 1
+        try:
+            return self.get_executor().submit(func, *args).result()
+        finally:
+            with self.lock:
+                self.pending -= 1
+            self.slots.release()
+
+
+class PasswordHasher:
+    """
+    Hashes and verifies passwords with bcrypt off the request thread.
+    bcrypt releases the GIL, so the pool bounds how many cores auth
+    requests can take while the rest keep serving other endpoints
+    """
+
+    def __init__(self, app=None):
+        """Initialising the hasher"""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registers the hashing pool and the busy error handler"""
+        app.extensions['password_hasher'] = _HasherState(app)
+        app.register_error_handler(HasherBusy, self.busy_response)
+
+    @staticmethod
+    def _state():
+        """Returns the state of the current app"""
+        return current_app.extensions['password_hasher']
+
+    @staticmethod
+    def busy_response(error):
+        """Returns 503 asking the client to retry later"""
+        response = make_response(jsonify({
+            'status': 'Failed',
+            'message': 'Too many requests, try again later'
+        }))
+        response.status_code = 503
+        response.headers['Retry-After'] = str(
+            current_app.config.get('BCRYPT_RETRY_AFTER'))
+        return response
+
+    def generate(self, password):
+        """Returns the bcrypt hash of a password"""
+        state = self._state()
+        return state.run(
+            state.bcrypt.generate_password_hash, password).decode()
+
+    def check(self, pw_hash, password):
+        """Returns whether a password matches its bcrypt hash"""
+        state = self._state()
+        return state.run(state.bcrypt.check_password_hash, pw_hash, password)
+
+    def needs_rehash(self, pw_hash):
+        """Returns whether a hash was computed with another cost"""
+        return hash_rounds(pw_hash) != self._state().log_rounds
+
+    def pending(self):
+        """Returns the number of hashes running or queued"""
+        return self._state().pending
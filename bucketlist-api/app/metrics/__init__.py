@@ -0,0 +1,6 @@
+"""Initialising the metrics blueprint exporting Prometheus metrics"""
+from flask import Blueprint
+
+metrics_blueprint = Blueprint('metrics', __name__)
+
+from . import views
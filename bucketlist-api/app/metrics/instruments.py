@@ -0,0 +1,135 @@
+"""Module records the Prometheus metrics of requests and worker pools"""
+import os
+import threading
+import time
+from flask import current_app, g, request
+from prometheus_client import Counter, Gauge, Histogram
+
+REQUESTS = Counter(
+    'http_requests_total', 'Requests served',
+    ['endpoint', 'method', 'status'])
+LATENCY = Histogram(
+    'http_request_duration_seconds',
+    'Seconds from receiving a request to sending the last of its body',
+    ['endpoint', 'method'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests being served',
+    multiprocess_mode='livesum')
+DB_POOL = Gauge(
+    'db_pool_connections', 'Connections of the database pools',
+    ['state'], multiprocess_mode='livesum')
+DB_CHECKOUTS = Counter(
+    'db_pool_checkouts_total', 'Connections checked out of the pools')
+DB_CHECKOUT_WAIT = Counter(
+    'db_pool_checkout_wait_seconds_total',
+    'Seconds spent waiting for connections')
+BCRYPT_PENDING = Gauge(
+    'bcrypt_pending_hashes', 'Password hashes running or queued',
+    multiprocess_mode='livesum')
+TOKEN_CACHE_ENTRIES = Gauge(
+    'token_cache_entries', 'Verified tokens cached',
+    multiprocess_mode='livesum')
+TOKEN_CACHE_LOOKUPS = Counter(
+    'token_cache_lookups_total', 'Lookups of verified tokens', ['result'])
+
+
+class _Totals:
+    """
+    The last totals of this process added to counters, so only what they
+    grew by since is added next time
+    """
+
+    def __init__(self):
+        """Initialising the totals"""
+        self.lock = threading.Lock()
+        self.seen = {}
+        self.pid = None
+
+    def advance(self, counter, key, total):
+        """Adds to counter what total grew by since it was last seen"""
+        with self.lock:
+            if self.pid != os.getpid():
+                self.pid = os.getpid()
+                self.seen = {}
+            last = self.seen.get(key, 0)
+            self.seen[key] = total
+        if total > last:
+            counter.inc(total - last)
+        elif total < last:
+            # the pool or cache was recreated and counts from zero again
+            counter.inc(total)
+
+
+class RequestMetrics:
+    """
+    Times every request by endpoint and samples the database pool, the
+    password hashing pool and the token cache at most once every
+    METRICS_SAMPLE_INTERVAL seconds, keeping the cost per request to a
+    few counter updates
+    """
+
+    def __init__(self, app=None):
+        """Initialising the metrics"""
+        self.totals = _Totals()
+        self.sampled_at = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Records the metrics of the requests of the app"""
+        app.before_request(self.start)
+        app.after_request(self.record_status)
+        app.teardown_request(self.finish)
+
+    @staticmethod
+    def start():
+        """Notes the start of a request"""
+        g.metrics_started = time.perf_counter()
+        g.metrics_status = None
+        IN_FLIGHT.inc()
+
+    @staticmethod
+    def record_status(response):
+        """Notes the status of a response"""
+        g.metrics_status = response.status_code
+        return response
+
+    def finish(self, error=None):
+        """
+        Records a request once its body is sent, teardown runs after a
+        streamed body ends
+        """
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        IN_FLIGHT.dec()
+        endpoint = request.endpoint or 'unmatched'
+        status = g.pop('metrics_status', None) or 500
+        LATENCY.labels(endpoint, request.method).observe(
+            time.perf_counter() - started)
+        REQUESTS.labels(endpoint, request.method, status).inc()
+        now = time.time()
+        if now - self.sampled_at >= current_app.config.get(
+                'METRICS_SAMPLE_INTERVAL'):
+            self.sampled_at = now
+            self.sample()
+
+    def sample(self):
+        """Copies the state of the pools and the cache into the metrics"""
+        from app import db, password_hasher, token_cache
+        pool = db.pool_stats()
+        for state in ('checked_out', 'checked_in', 'overflow'):
+            if state in pool:
+                DB_POOL.labels(state).set(pool[state])
+        if 'checkouts' in pool:
+            self.totals.advance(DB_CHECKOUTS, 'checkouts', pool['checkouts'])
+            self.totals.advance(
+                DB_CHECKOUT_WAIT, 'wait_total', pool['wait_total'])
+        BCRYPT_PENDING.set(password_hasher.pending())
+        cache = token_cache.stats()
+        TOKEN_CACHE_ENTRIES.set(cache['size'])
+        self.totals.advance(
+            TOKEN_CACHE_LOOKUPS.labels('hit'), 'hits', cache['hits'])
+        self.totals.advance(
+            TOKEN_CACHE_LOOKUPS.labels('miss'), 'misses', cache['misses'])
@@ -0,0 +1,64 @@
+"""views for metrics_blueprint"""
+import hmac
+import ipaddress
+import os
+from flask import Response, current_app, make_response, request
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, generate_latest,
+    multiprocess)
+from app.renderers import jsonify
+from . import metrics_blueprint
+
+
+def scrape_allowed():
+    """
+    Returns whether the request comes from METRICS_ALLOWED_NETWORKS with
+    METRICS_TOKEN as its bearer token
+    """
+    config = current_app.config
+    try:
+        address = ipaddress.ip_address(request.remote_addr)
+    except ValueError:
+        return False
+    if not any(
+            address in ipaddress.ip_network(network, strict=False)
+            for network in config.get('METRICS_ALLOWED_NETWORKS')):
+        return False
+    token = config.get('METRICS_TOKEN')
+    if not token:
+        return False
+    return hmac.compare_digest(
+        request.headers.get('Authorization', ''), 'Bearer ' + token)
+
+
+@metrics_blueprint.before_request
+def check_scraper():
+    """Turns away requests for metrics that are not allowed to scrape"""
+    if not scrape_allowed():
+        response = {
+            'status': 'Failed',
+            'message': 'Not allowed to read metrics'
+        }
+        return make_response(jsonify(response)), 403
+
+
+@metrics_blueprint.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Metrics of every worker in the Prometheus text format
+    ---
+    tags:
+     - "metrics"
+    produces:
+     - "text/plain"
+    responses:
+        403:
+            description: "not from an allowed network or without the token"
+        200:
+            description: "success"
+     """
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return Response(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST)
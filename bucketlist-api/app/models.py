@@ -1,9 +1,55 @@
 """Module for all the models for the bucketlist app"""
-from app import db
-from flask_bcrypt import Bcrypt
+from app import db, revocations, token_cache, password_hasher
+from app.revocation import token_digest
 from flask import current_app
+from sqlalchemy import event, func, select, DDL
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload, lazyload, load_only, subqueryload
 import jwt
 import datetime
+import uuid
+
+
+# the trigram indexes on names need pg_trgm before the tables are created
+event.listen(
+    db.Model.metadata,
+    'before_create',
+    DDL('CREATE EXTENSION IF NOT EXISTS pg_trgm').execute_if(
+        dialect='postgresql'))
+
+
+def insert_rows(table, rows):
+    """
+    Inserts rows into table with one multi-row insert in a savepoint.
+    When it breaks a constraint, as a row inserted concurrently would,
+    the rows are inserted one at a time instead and the indexes of the
+    rows that could not be inserted are returned
+    """
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(rows))
+        return []
+    except IntegrityError:
+        pass
+    failed = []
+    for index, row in enumerate(rows):
+        try:
+            with db.session.begin_nested():
+                db.session.execute(table.insert().values(row))
+        except IntegrityError:
+            failed.append(index)
+    return failed
+
+
+def name_contains(column, query):
+    """
+    Returns a filter for names containing query, with the wildcards in
+    query escaped. On PostgreSQL the ILIKE is answered from the trigram
+    index on the column
+    """
+    escaped = query.replace('\\', '\\\\').replace(
+        '%', '\\%').replace('_', '\\_')
+    return column.ilike("%" + escaped + "%", escape='\\')
 
 
 class User(db.Model):
@@ -25,12 +71,21 @@ class User(db.Model):
         self.firstname = firstname
         self.lastname = lastname
         self.username = username
-        self.password = Bcrypt().generate_password_hash(password).decode()
+        self.password = password_hasher.generate(password)
         self.email = email
 
     def password_is_valid(self, password):
         """Method validates password against its hash"""
-        return Bcrypt().check_password_hash(self.password, password)
+        return password_hasher.check(self.password, password)
+
+    def rehash_password(self, password):
+        """
+        Method rehashes a validated password whose hash was computed
+        with another cost than the configured one
+        """
+        if password_hasher.needs_rehash(self.password):
+            self.password = password_hasher.generate(password)
+            self.save()
 
     def encode_auth_token(self, user_id):
         """Generates an authentication token"""
@@ -39,7 +94,8 @@ class User(db.Model):
                 'exp': datetime.datetime.utcnow() + datetime.timedelta(
                     seconds=current_app.config.get('TOKEN_TIME')),
                 'iat': datetime.datetime.utcnow(),
-                'sub': user_id
+                'sub': user_id,
+                'jti': uuid.uuid4().hex
             }
             jwt_string = jwt.encode(
                 payload,
@@ -64,33 +120,67 @@ class User(db.Model):
         """ """
         return '<User %r>' % (self.name)
 
+    @staticmethod
+    def decode_auth_payload(token):
+        """
+        Method decodes authentication token returning its claims, tokens
+        issued without a jti are identified by their digest. Tokens are
+        only verified once while they are held in the token cache
+        """
+        payload = token_cache.get(token)
+        if payload is None:
+            try:
+                payload = jwt.decode(
+                    token,
+                    current_app.config.get('SECRET')
+                    )
+            except jwt.ExpiredSignatureError:
+                return 'Expired token'
+            except jwt.InvalidTokenError:
+                return 'Invalid token'
+            payload.setdefault('jti', token_digest(token))
+            token_cache.set(token, payload)
+        if BlacklistToken.blacklisted(payload['jti']):
+            return 'Token no longer valid login again'
+        return payload
+
     @staticmethod
     def decode_auth_token(token):
         """Method decodes authentication token"""
-        try:
-            payload = jwt.decode(
-                token,
-                current_app.config.get('SECRET')
-                )
-            token_blacklisted = BlacklistToken.blacklisted(token)
-            if token_blacklisted:
-                return 'Token no longer valid login again'
-            return payload['sub']
-        except jwt.ExpiredSignatureError:
-            return 'Expired token'
-        except jwt.InvalidTokenError:
-            return 'Invalid token'
+        payload = User.decode_auth_payload(token)
+        if isinstance(payload, str):
+            return payload
+        return payload['sub']
 
 
 class Bucketlist(db.Model):
     """Class to define the bucketlists table"""
     __tablename__ = 'bucketlists'
+    __table_args__ = (
+        db.Index('ix_bucketlists_owner_id', 'owner', 'id'),
+        db.Index(
+            'ix_bucketlists_owner_name_to_compare', 'owner',
+            'name_to_compare', unique=True),
+        db.Index(
+            'ix_bucketlists_name_trgm', 'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
+    # the fields of to_json, which sparse fieldsets choose from
+    JSON_FIELDS = (
+        'id', 'name', 'description', 'owner', 'date_created',
+        'date_modified', 'items')
     id = db.Column(db.Integer, primary_key=True)
-    name_to_compare = db.Column(db.String(256), nullable=False, unique=True)
+    name_to_compare = db.Column(db.String(256), nullable=False)
     name = db.Column(db.String(256), nullable=False)
     description = db.Column(db.Text)
-    date_created = db.Column(db.DateTime, default=datetime.datetime.utcnow())
+    date_created = db.Column(db.DateTime, default=datetime.datetime.utcnow)
     date_modified = db.Column(db.DateTime)
+    version = db.Column(
+        db.Integer, nullable=False, default=1, server_default='1')
+    item_count = db.Column(
+        db.Integer, nullable=False, default=0, server_default='0')
+    last_item_at = db.Column(db.DateTime)
     owner = db.Column(db.Integer, db.ForeignKey(User.id, ondelete='cascade'))
     items = db.relationship(
         'Item',
@@ -114,23 +204,121 @@ class Bucketlist(db.Model):
         db.session.delete(self)
         db.session.commit()
 
-    def to_json(self):
-        """Method converts a bucketlist to a json object"""
-        json_data = {
-            'id': self.id,
-            'name': self.name,
-            'description': self.description,
-            'owner': self.owner,
-            'date_created': self.date_created,
-            'date_modified': self.date_modified,
-            'items': {item.id: item.to_json() for item in self.items}
-        }
+    def to_json(self, fields=None, items_fields=None):
+        """
+        Method converts a bucketlist to a json object, with only fields
+        and items with only items_fields when they are given
+        """
+        if fields is None:
+            fields = Bucketlist.JSON_FIELDS
+        json_data = {}
+        for field in fields:
+            if field == 'items':
+                json_data['items'] = {
+                    item.id: item.to_json(items_fields)
+                    for item in self.items}
+            else:
+                json_data[field] = getattr(self, field)
         return json_data
 
     @staticmethod
-    def get_all_bucketlists(owner_id):
+    def touch(bucketlist_id, items=0):
+        """
+        Method bumps the version and modification date of a bucketlist
+        in the current transaction, for changes made to its items, adding
+        items to its item count. Adding items also sets last_item_at.
+        None of these columns are indexed, so the update stays HOT
+        """
+        now = datetime.datetime.utcnow()
+        values = {
+            Bucketlist.version: Bucketlist.version + 1,
+            Bucketlist.date_modified: now
+        }
+        if items:
+            values[Bucketlist.item_count] = Bucketlist.item_count + items
+        if items > 0:
+            values[Bucketlist.last_item_at] = now
+        Bucketlist.query.filter_by(id=bucketlist_id).update(values)
+
+    @staticmethod
+    def listing_state(owner_id):
+        """
+        Method returns the number, highest id and total version of the
+        bucketlists of a user, which change whenever the listing does
+        """
+        return db.session.query(
+            func.count(Bucketlist.id),
+            func.max(Bucketlist.id),
+            func.coalesce(func.sum(Bucketlist.version), 0)
+        ).filter(Bucketlist.owner == owner_id).one()
+
+    @staticmethod
+    def get_summaries(owner_id):
+        """
+        Method returns the id, name, item count and last item date of the
+        bucketlists of a user in one query, without loading their items
+        """
+        return db.session.query(
+            Bucketlist.id,
+            Bucketlist.name,
+            Bucketlist.item_count,
+            Bucketlist.last_item_at
+        ).filter(Bucketlist.owner == owner_id).order_by(Bucketlist.id)
+
+    @staticmethod
+    def summary_to_json(summary):
+        """Method converts a row of get_summaries to a json object"""
+        return {
+            'id': summary.id,
+            'name': summary.name,
+            'item_count': summary.item_count,
+            'last_item_at': summary.last_item_at
+        }
+
+    @staticmethod
+    def items_loader():
+        """
+        Returns the loader option used to fetch the items of bucketlists,
+        configured through BUCKETLIST_ITEMS_LOADING
+        """
+        strategy = current_app.config.get('BUCKETLIST_ITEMS_LOADING')
+        if strategy == 'joined':
+            return joinedload(Bucketlist.items)
+        if strategy == 'select':
+            return lazyload(Bucketlist.items)
+        return subqueryload(Bucketlist.items)
+
+    @staticmethod
+    def fields_loader(fields=None, items_fields=None):
+        """
+        Returns the loader options fetching only the columns of fields,
+        and of items_fields for the items, which are not loaded at all
+        unless fields asks for them
+        """
+        options = []
+        if fields is not None:
+            options.append(load_only(*Bucketlist.columns_of(fields)))
+        if fields is not None and 'items' not in fields:
+            options.append(lazyload(Bucketlist.items))
+        elif items_fields is not None:
+            options.append(Bucketlist.items_loader().load_only(
+                *Item.columns_of(items_fields)))
+        else:
+            options.append(Bucketlist.items_loader())
+        return options
+
+    @staticmethod
+    def columns_of(fields):
+        """Returns the columns to load for fields, the id always"""
+        return ['id'] + [
+            field for field in fields if field not in ('id', 'items')]
+
+    @staticmethod
+    def get_all_bucketlists(owner_id, fields=None, items_fields=None):
         """Method returns all bucketlists owned by a given user"""
-        return Bucketlist.query.filter_by(owner=owner_id)
+        return Bucketlist.query.options(
+            *Bucketlist.fields_loader(fields, items_fields)
+        ).filter_by(owner=owner_id).order_by(Bucketlist.id)
 
     def __repr__(self):
         """A representation for an instance of a bucketlist"""
@@ -140,9 +328,21 @@ class Bucketlist(db.Model):
 class Item(db.Model):
     """Class to define the Items table"""
     __tablename__ = 'items'
+    __table_args__ = (
+        db.Index('ix_items_bucketlist_id_id', 'bucketlist_id', 'id'),
+        db.Index(
+            'ix_items_bucketlist_id_name_to_compare', 'bucketlist_id',
+            'name_to_compare', unique=True),
+        db.Index(
+            'ix_items_name_trgm', 'name',
+            postgresql_using='gin',
+            postgresql_ops={'name': 'gin_trgm_ops'}),
+    )
+    # the fields of to_json, which sparse fieldsets choose from
+    JSON_FIELDS = ('id', 'name', 'description', 'bucketlist_id')
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(256), nullable=False)
-    name_to_compare = db.Column(db.String(256), nullable=False, unique=True)
+    name_to_compare = db.Column(db.String(256), nullable=False)
     description = db.Column(db.Text)
     bucketlist_id = db.Column(
         db.Integer,
@@ -169,8 +369,10 @@ class Item(db.Model):
         db.session.delete(self)
         db.session.commit()
 
-    def to_json(self):
-        """Method converts bucketlists to json"""
+    def to_json(self, fields=None):
+        """Method converts bucketlists to json, with only fields if given"""
+        if fields is not None:
+            return {field: getattr(self, field) for field in fields}
         json_data = {
             'id': self.id,
             'name': self.name,
@@ -180,37 +382,171 @@ class Item(db.Model):
         return json_data
 
     @staticmethod
-    def get_all_items(bucketlist_id):
+    def columns_of(fields):
+        """Returns the columns to load for fields, the id always"""
+        return ['id'] + [field for field in fields if field != 'id']
+
+    @staticmethod
+    def fields_loader(fields=None):
+        """Returns the loader options fetching only the columns of fields"""
+        if fields is None:
+            return []
+        return [load_only(*Item.columns_of(fields))]
+
+    @staticmethod
+    def bulk_create(bucketlist_id, rows):
+        """
+        Creates items from dicts of name and description with a single
+        duplicate check and a single multi-row insert in one transaction.
+        Returns a result for every row, rows that are invalid or whose
+        name is already taken in the bucketlist are not created
+        """
+        results = [None] * len(rows)
+        new_items = {}
+        for index, row in enumerate(rows):
+            if not isinstance(row, dict) or \
+                    not isinstance(row.get('name'), str) or \
+                    'description' not in row:
+                results[index] = {
+                    'index': index,
+                    'status': 'Failed',
+                    'message': 'Invalid payload'
+                }
+                continue
+            name_to_compare = ''.join(row['name'].lower().split())
+            if name_to_compare in new_items:
+                results[index] = {
+                    'index': index,
+                    'status': 'Failed',
+                    'message': 'Item already exists'
+                }
+                continue
+            new_items[name_to_compare] = index
+        if new_items:
+            existing = db.session.query(Item.name_to_compare).filter(
+                Item.bucketlist_id == bucketlist_id,
+                Item.name_to_compare.in_(list(new_items))
+            )
+            for (name_to_compare,) in existing:
+                index = new_items.pop(name_to_compare)
+                results[index] = {
+                    'index': index,
+                    'status': 'Failed',
+                    'message': 'Item already exists'
+                }
+        if new_items:
+            pending = list(new_items.items())
+            failed = insert_rows(Item.__table__, [
+                {
+                    'name': rows[index]['name'],
+                    'name_to_compare': name_to_compare,
+                    'description': rows[index]['description'],
+                    'bucketlist_id': bucketlist_id
+                }
+                for name_to_compare, index in pending
+            ])
+            for position in failed:
+                name_to_compare, index = pending[position]
+                del new_items[name_to_compare]
+                results[index] = {
+                    'index': index,
+                    'status': 'Failed',
+                    'message': 'Item already exists'
+                }
+        if new_items:
+            created = db.session.query(
+                Item.name_to_compare, Item.id
+            ).filter(
+                Item.bucketlist_id == bucketlist_id,
+                Item.name_to_compare.in_(list(new_items))
+            )
+            for name_to_compare, item_id in created:
+                index = new_items[name_to_compare]
+                results[index] = {
+                    'index': index,
+                    'status': 'Success',
+                    'id': item_id,
+                    'name': rows[index]['name'],
+                    'description': rows[index]['description'],
+                    'bucketlist_id': bucketlist_id
+                }
+            Bucketlist.touch(bucketlist_id, len(new_items))
+        db.session.commit()
+        return results
+
+    @staticmethod
+    def get_all_items(bucketlist_id, fields=None):
         """Method returns all items in a given bucketlist"""
-        return Item.query.filter_by(bucketlist_id=bucketlist_id)
+        return Item.query.options(*Item.fields_loader(fields)).filter_by(
+            bucketlist_id=bucketlist_id).order_by(Item.id)
 
 
 class BlacklistToken(db.Model):
     """
-    Model for storing expired jwt tokens
+    Model for storing the identifiers of revoked jwt tokens
+    until the tokens expire
 
     """
     __tablename__ = 'blacklist_token'
+    # revocations are always read from the primary, a replica lagging
+    # behind would accept tokens that were just logged out
+    __table_args__ = {'info': {'read_from_primary': True}}
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    token = db.Column(db.String, unique=True, nullable=False)
+    jti = db.Column(db.String(64), unique=True, nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
 
-    def __init__(self, token):
+    def __init__(self, jti, expires_at):
         """ """
-        self.token = token
+        self.jti = jti
+        self.expires_at = expires_at
 
     def save(self):
-        """Save token in database """
+        """Save token in database and announce it to every worker"""
         db.session.add(self)
+        revocations.publish(db.session, self.jti)
         db.session.commit()
+        revocations.add(self.jti)
 
     def __repr__(self):
         """ """
-        return '<token: {}'.format(self.token)
+        return '<token: {}'.format(self.jti)
+
+    @staticmethod
+    def identifiers():
+        """Returns the identifiers of all blacklisted unexpired tokens"""
+        tokens = db.session.query(BlacklistToken.jti).filter(
+            BlacklistToken.expires_at > datetime.datetime.utcnow()
+        ).yield_per(1000)
+        return (jti for (jti,) in tokens)
 
     @staticmethod
-    def blacklisted(token):
-        """Returns whether the a token is blacklisted or not """
-        token = BlacklistToken.query.filter_by(token=str(token)).first()
+    def blacklisted(jti):
+        """
+        Returns whether the a token is blacklisted or not, only tokens
+        the revocation cache may hold are looked up in the database
+        """
+        if not revocations.might_be_revoked(jti):
+            return False
+        token = BlacklistToken.query.filter_by(jti=jti).first()
         if token:
             return True
         return False
+
+    @staticmethod
+    def purge_expired(batch_size=1000):
+        """
+        Deletes expired tokens a batch per transaction so that no
+        long running lock is held, returns the number of tokens deleted
+        """
+        table = BlacklistToken.__table__
+        purged = 0
+        while True:
+            expired = select([table.c.id]).where(
+                table.c.expires_at < datetime.datetime.utcnow()
+            ).order_by(table.c.expires_at).limit(batch_size)
+            result = db.session.execute(
+                table.delete().where(table.c.id.in_(expired)))
+            db.session.commit()
+            purged += result.rowcount
+            if result.rowcount < batch_size:
+                return purged
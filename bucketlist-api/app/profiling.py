@@ -0,0 +1,144 @@
+"""Module counts and times the SQL statements run by every request"""
+import heapq
+import logging
+import time
+from flask import current_app, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+class _RequestProfile:
+    """The statements run by one request"""
+
+    def __init__(self, keep):
+        """Initialising the profile, keeping the keep slowest statements"""
+        self.started = time.perf_counter()
+        self.keep = keep
+        self.count = 0
+        self.duration = 0.0
+        self.slowest = []
+
+    def record(self, statement, duration):
+        """Adds a statement that ran for duration seconds"""
+        self.count += 1
+        self.duration += duration
+        if not self.keep:
+            return
+        entry = (duration, self.count, statement)
+        if len(self.slowest) < self.keep:
+            heapq.heappush(self.slowest, entry)
+        else:
+            heapq.heappushpop(self.slowest, entry)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    """Notes when a statement starts"""
+    conn.info.setdefault('profiling_started', []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    """Adds a finished statement to the profile of the current request"""
+    started = conn.info.get('profiling_started')
+    if not started:
+        return
+    duration = time.perf_counter() - started.pop()
+    if has_request_context() and 'sql_profile' in g:
+        g.sql_profile.record(statement, duration)
+
+
+def _handle_error(context):
+    """
+    Adds a statement that failed to the profile, so its start does not
+    linger and skew the timings of later statements on the connection
+    """
+    if context.connection is None or context.cursor is None:
+        return
+    _after_cursor_execute(
+        context.connection, context.cursor, context.statement,
+        context.parameters, context.execution_context, False)
+
+
+class QueryProfiler:
+    """
+    Counts the statements every request runs on any engine and the time
+    they take. The totals are sent as Server-Timing and X-Query-Count
+    headers with SQL_PROFILING_HEADERS, and requests going over
+    SQL_PROFILING_MAX_QUERIES or SQL_PROFILING_MAX_DB_MS are logged with
+    their slowest statements
+    """
+
+    def __init__(self, app=None):
+        """Initialising the profiler"""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Profiles the requests of the app"""
+        if not event.contains(
+                Engine, 'before_cursor_execute', _before_cursor_execute):
+            event.listen(
+                Engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(
+                Engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(Engine, 'handle_error', _handle_error)
+        app.before_request(self.start)
+        app.after_request(self.add_headers)
+        app.teardown_request(self.log_slow_request)
+
+    @staticmethod
+    def enabled():
+        """Returns whether the current app wants requests profiled"""
+        config = current_app.config
+        return bool(
+            config.get('SQL_PROFILING_HEADERS') or
+            config.get('SQL_PROFILING_MAX_QUERIES') or
+            config.get('SQL_PROFILING_MAX_DB_MS'))
+
+    def start(self):
+        """Starts the profile of a request"""
+        g.pop('sql_profile', None)
+        if self.enabled():
+            g.sql_profile = _RequestProfile(
+                current_app.config.get('SQL_PROFILING_SLOWEST'))
+
+    @staticmethod
+    def add_headers(response):
+        """
+        Adds the statements run so far, a streamed body runs its own
+        statements after the headers are sent
+        """
+        profile = g.get('sql_profile')
+        if profile is None or \
+                not current_app.config.get('SQL_PROFILING_HEADERS'):
+            return response
+        elapsed = time.perf_counter() - profile.started
+        response.headers['X-Query-Count'] = str(profile.count)
+        response.headers.add(
+            'Server-Timing',
+            'db;dur={:.1f};desc="{} queries", app;dur={:.1f}'.format(
+                profile.duration * 1000, profile.count, elapsed * 1000))
+        return response
+
+    @staticmethod
+    def log_slow_request(error=None):
+        """Logs a request over the thresholds with its slowest statements"""
+        profile = g.get('sql_profile')
+        if profile is None:
+            return
+        config = current_app.config
+        max_queries = config.get('SQL_PROFILING_MAX_QUERIES')
+        max_db_ms = config.get('SQL_PROFILING_MAX_DB_MS')
+        if (max_queries and profile.count > max_queries) or \
+                (max_db_ms and profile.duration * 1000 > max_db_ms):
+            logger.warning(
+                '%s %s ran %d statements in %.1fms, the slowest:%s',
+                request.method, request.full_path, profile.count,
+                profile.duration * 1000,
+                ''.join(
+                    '\n  {:.1f}ms {}'.format(duration * 1000, statement)
+                    for duration, _, statement
+                    in sorted(profile.slowest, reverse=True)))
@@ -0,0 +1,138 @@
+"""Module renders JSON responses with the configured serializer"""
+import datetime
+import logging
+import uuid
+from flask import current_app, request, jsonify as flask_jsonify, \
+    json as flask_json
+from werkzeug.http import http_date
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class StdlibRenderer:
+    """Renders with flask.json, the output of flask.jsonify as is"""
+
+    name = 'stdlib'
+
+    def __init__(self, app):
+        """Initialising the renderer"""
+
+    @staticmethod
+    def jsonify(data):
+        """Returns a response of data"""
+        return flask_jsonify(data)
+
+    @staticmethod
+    def dumps(data):
+        """Returns data as compact JSON text"""
+        return flask_json.dumps(data)
+
+
+def _orjson_default(value):
+    """Encodes the types flask.json encodes and orjson does not"""
+    if isinstance(value, datetime.date):
+        return http_date(value.timetuple())
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    if hasattr(value, '__html__'):
+        return str(value.__html__())
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+class OrjsonRenderer:
+    """
+    Renders with orjson. Dates keep the HTTP date format of flask.json
+    and integer keys are turned into strings the same way. Besides the
+    whitespace and the escaping of non-ASCII characters, the order of
+    integer keys differs: orjson sorts them as the strings they become,
+    10 before 9, where flask.json sorts them as numbers
+    """
+
+    name = 'orjson'
+
+    def __init__(self, app):
+        """Initialising the options from the app configuration"""
+        self.option = orjson.OPT_NON_STR_KEYS | \
+            orjson.OPT_PASSTHROUGH_DATETIME
+        if app.config.get('JSON_SORT_KEYS'):
+            self.option |= orjson.OPT_SORT_KEYS
+
+    def jsonify(self, data):
+        """Returns a response of data, indented like flask.jsonify"""
+        option = self.option
+        if current_app.config.get('JSONIFY_PRETTYPRINT_REGULAR') and \
+                not request.is_xhr:
+            option |= orjson.OPT_INDENT_2
+        return current_app.response_class(
+            orjson.dumps(data, default=_orjson_default, option=option) +
+            b'\n',
+            mimetype=current_app.config.get('JSONIFY_MIMETYPE'))
+
+    def dumps(self, data):
+        """Returns data as compact JSON text"""
+        return orjson.dumps(
+            data, default=_orjson_default, option=self.option).decode()
+
+
+RENDERERS = {
+    'stdlib': StdlibRenderer,
+    'orjson': OrjsonRenderer
+}
+
+
+def _available(name):
+    """Returns whether the serializer of a renderer is installed"""
+    return name != 'orjson' or orjson is not None
+
+
+class JSONRenderer:
+    """
+    Picks the renderer named by JSON_RENDERER, auto picks the fastest one
+    installed. A renderer whose serializer is missing falls back to the
+    standard library
+    """
+
+    def __init__(self, app=None):
+        """Initialising the extension"""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registers the renderer of the app"""
+        name = app.config.get('JSON_RENDERER', 'stdlib')
+        if name == 'auto':
+            name = 'orjson' if _available('orjson') else 'stdlib'
+        elif name not in RENDERERS:
+            raise ValueError('Unknown JSON_RENDERER {!r}'.format(name))
+        elif not _available(name):
+            logger.warning('%s is not installed, rendering JSON with the '
+                           'standard library', name)
+            name = 'stdlib'
+        app.extensions['json_renderer'] = RENDERERS[name](app)
+
+
+def _renderer():
+    """Returns the renderer of the current app"""
+    return current_app.extensions['json_renderer']
+
+
+def jsonify(*args, **kwargs):
+    """Returns a JSON response, takes the arguments of flask.jsonify"""
+    if args and kwargs:
+        raise TypeError('jsonify() behavior undefined when passed both '
+                        'args and kwargs')
+    elif len(args) == 1:
+        data = args[0]
+    else:
+        data = args or kwargs
+    return _renderer().jsonify(data)
+
+
+def dumps(data):
+    """Returns data as compact JSON text"""
+    return _renderer().dumps(data)
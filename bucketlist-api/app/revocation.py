@@ -0,0 +1,218 @@
+"""Module keeps the revoked auth tokens of a worker in memory"""
+import hashlib
+import logging
+import math
+import os
+import select
+import threading
+import time
+from flask import current_app
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = 'token_revoked'
+
+
+def token_digest(token):
+    """Returns the identifier a token is revoked under"""
+    return hashlib.sha256(str(token).encode()).hexdigest()
+
+
+class BloomFilter:
+    """Fixed size set of identifiers that may report false positives"""
+
+    def __init__(self, capacity, error_rate):
+        """Sizes the filter to hold capacity identifiers at error_rate"""
+        capacity = max(int(capacity), 1)
+        self.size = int(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)) + 1
+        self.hashes = max(int(self.size / capacity * math.log(2)), 1)
+        self.bits = bytearray(self.size // 8 + 1)
+
+    def _positions(self, identifier):
+        """Returns the bit positions of an identifier"""
+        digest = hashlib.sha256(identifier.encode()).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hashes)]
+
+    def add(self, identifier):
+        """Adds an identifier to the filter"""
+        for position in self._positions(identifier):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, identifier):
+        """Returns False when the identifier was certainly never added"""
+        return all(
+            self.bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(identifier))
+
+
+class MemoryNotifier:
+    """Delivers revocations to the caches listening in this process"""
+
+    def __init__(self):
+        """Initialising the notifier"""
+        self.listeners = []
+
+    def publish(self, session, identifier):
+        """Hands the identifier to every listener"""
+        for listener in list(self.listeners):
+            listener(identifier)
+
+    def listen(self, database_uri, callback):
+        """Registers callback for identifiers published from now on"""
+        self.listeners.append(callback)
+
+
+class PostgresNotifier:
+    """Delivers revocations to every worker through LISTEN/NOTIFY"""
+
+    def __init__(self, on_reconnect, retry_interval=5):
+        """
+        on_reconnect is called whenever the listening connection is
+        re-established since notifications may have been missed
+        """
+        self.on_reconnect = on_reconnect
+        self.retry_interval = retry_interval
+
+    def publish(self, session, identifier):
+        """Queues a notification, sent when the session commits"""
+        session.execute(
+            text('SELECT pg_notify(:channel, :identifier)'),
+            {'channel': CHANNEL, 'identifier': identifier})
+
+    def listen(self, database_uri, callback):
+        """Starts a daemon thread calling callback for every notification"""
+        thread = threading.Thread(
+            target=self._listen,
+            args=(database_uri, callback),
+            name='revocation-listener')
+        thread.daemon = True
+        thread.start()
+
+    def _listen(self, database_uri, callback):
+        """Listens on a dedicated connection, reconnecting on failure"""
+        engine = create_engine(database_uri, poolclass=NullPool)
+        first_connection = True
+        while True:
+            try:
+                connection = engine.raw_connection()
+                connection.connection.autocommit = True
+                cursor = connection.cursor()
+                cursor.execute('LISTEN {}'.format(CHANNEL))
+                if not first_connection:
+                    self.on_reconnect()
+                first_connection = False
+                while True:
+                    select.select([connection.connection], [], [], 60)
+                    connection.connection.poll()
+                    notifies = connection.connection.notifies
+                    while notifies:
+                        callback(notifies.pop(0).payload)
+            except Exception:
+                logger.exception('Revocation listener lost its connection')
+                time.sleep(self.retry_interval)
+
+
+class _RevocationState:
+    """The revoked tokens of one application in one worker process"""
+
+    def __init__(self, app):
+        """Initialising the state from the app configuration"""
+        self.capacity = app.config.get('REVOCATION_BLOOM_CAPACITY')
+        self.error_rate = app.config.get('REVOCATION_BLOOM_ERROR_RATE')
+        self.reload_interval = app.config.get('REVOCATION_RELOAD_INTERVAL')
+        self.database_uri = app.config.get('SQLALCHEMY_DATABASE_URI')
+        if app.config.get('REVOCATION_NOTIFIER') == 'memory':
+            self.notifier = MemoryNotifier()
+        else:
+            self.notifier = PostgresNotifier(on_reconnect=self.expire)
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.loaded_at = 0
+        self.pid = None
+
+    def expire(self):
+        """Forces a reload from the database on the next check"""
+        self.loaded_at = 0
+
+    def add(self, identifier):
+        """Adds an identifier to the filter"""
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(identifier)
+
+    def is_fresh(self, pid):
+        """Returns whether this process holds a filter young enough"""
+        return self.pid == pid and self.bloom is not None and \
+            time.time() - self.loaded_at < self.reload_interval
+
+    def ensure_loaded(self, load_identifiers):
+        """
+        Builds the filter in a new worker process or once it is older
+        than the reload interval, which also catches missed notifications.
+        Notifications received meanwhile wait for the lock and so land in
+        the new filter
+        """
+        pid = os.getpid()
+        if self.is_fresh(pid):
+            return
+        with self.lock:
+            if self.is_fresh(pid):
+                return
+            if self.pid != pid:
+                self.pid = pid
+                self.bloom = None
+                self.notifier.listen(self.database_uri, self.add)
+            identifiers = list(load_identifiers())
+            bloom = BloomFilter(
+                max(self.capacity, 2 * len(identifiers)), self.error_rate)
+            for identifier in identifiers:
+                bloom.add(identifier)
+            self.bloom = bloom
+            self.loaded_at = time.time()
+
+
+class RevocationCache:
+    """
+    Per worker Bloom filter of revoked token identifiers, so checking a
+    token that was never revoked does not need the database
+    """
+
+    def __init__(self, app=None):
+        """Initialising the cache"""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registers the cache state on the app"""
+        app.extensions['revocation_cache'] = _RevocationState(app)
+
+    @staticmethod
+    def _state():
+        """Returns the state of the current app"""
+        return current_app.extensions['revocation_cache']
+
+    def might_be_revoked(self, identifier):
+        """
+        Returns False when the identifier is certainly not revoked, True
+        when it is revoked or is a false positive of the filter
+        """
+        from app.models import BlacklistToken
+        state = self._state()
+        state.ensure_loaded(BlacklistToken.identifiers)
+        return identifier in state.bloom
+
+    def publish(self, session, identifier):
+        """
+        Announces a revocation to every worker, on PostgreSQL the
+        notification is delivered once the session commits
+        """
+        self._state().notifier.publish(session, identifier)
+
+    def add(self, identifier):
+        """Records a revocation in this worker straight away"""
+        self._state().add(identifier)
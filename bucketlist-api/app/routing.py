@@ -0,0 +1,192 @@
+"""Module routes the reads of read-only requests to database replicas"""
+import itertools
+import logging
+import threading
+import time
+from flask import current_app, g, has_request_context, request
+from flask_sqlalchemy import SignallingSession
+from sqlalchemy import create_engine, text
+from sqlalchemy.pool import NullPool
+
+logger = logging.getLogger(__name__)
+
+READ_METHODS = ('GET', 'HEAD')
+
+STICKY_COOKIE = 'read_primary_until'
+
+
+class Replica:
+    """A replica engine and the outcome of its last health check"""
+
+    def __init__(self, engine, timeout):
+        """
+        Initialising the replica. The health check connects on its own,
+        giving up on connecting and on the query after timeout seconds
+        """
+        self.engine = engine
+        self.timeout = timeout
+        self.probe = create_engine(
+            engine.url, poolclass=NullPool,
+            connect_args={'connect_timeout': max(int(timeout), 1)})
+        self.healthy = False
+        self.checked_at = 0
+
+    def check(self, max_lag):
+        """
+        Returns whether the replica answers and replays the primary within
+        max_lag seconds. A database that is not replaying reports no lag
+        """
+        try:
+            with self.probe.connect() as connection, connection.begin():
+                connection.execute(text(
+                    'SET LOCAL statement_timeout = {:d}'.format(
+                        int(self.timeout * 1000))))
+                lag = connection.execute(text(
+                    'SELECT extract(epoch FROM '
+                    'now() - pg_last_xact_replay_timestamp())')).scalar()
+        except Exception:
+            logger.exception('Replica %s failed its health check',
+                             self.engine.url)
+            return False
+        if lag is not None and max_lag and lag > max_lag:
+            logger.warning('Replica %s is %.1fs behind', self.engine.url, lag)
+            return False
+        return True
+
+
+class _ReplicaState:
+    """The replicas and the users reading from the primary of one app"""
+
+    def __init__(self, app, engines):
+        """Initialising the state from the app configuration"""
+        self.replicas = [
+            Replica(engine, app.config.get('REPLICA_CHECK_TIMEOUT'))
+            for engine in engines]
+        self.sticky_seconds = app.config.get('REPLICA_STICKY_SECONDS')
+        self.check_interval = app.config.get('REPLICA_CHECK_INTERVAL')
+        self.max_lag = app.config.get('REPLICA_MAX_LAG')
+        self.turns = itertools.count()
+        self.lock = threading.Lock()
+        self.sticky = {}
+
+    def choose(self):
+        """
+        Returns the engine of the next healthy replica in turn, None when
+        none is healthy. A replica is checked again once its last check is
+        older than the check interval, by the one request claiming the
+        check while the others go by the outcome of the last one
+        """
+        with self.lock:
+            start = next(self.turns)
+        for offset in range(len(self.replicas)):
+            replica = self.replicas[(start + offset) % len(self.replicas)]
+            with self.lock:
+                now = time.time()
+                due = now - replica.checked_at >= self.check_interval
+                if due:
+                    replica.checked_at = now
+            if due:
+                replica.healthy = replica.check(self.max_lag)
+            if replica.healthy:
+                return replica.engine
+        return None
+
+    def stick(self, user_id):
+        """Sends the reads of a user to the primary for a while"""
+        now = time.time()
+        with self.lock:
+            if len(self.sticky) > 10000:
+                self.sticky = {
+                    key: until for key, until in self.sticky.items()
+                    if until > now}
+            self.sticky[user_id] = now + self.sticky_seconds
+            return self.sticky[user_id]
+
+    def is_sticky(self, user_id):
+        """Returns whether a user wrote within the sticky window"""
+        return self.sticky.get(user_id, 0) > time.time()
+
+
+class ReplicaRouter:
+    """
+    Sends the reads of GET and HEAD requests to the replicas in
+    SQLALCHEMY_REPLICA_URIS in turn, skipping unhealthy ones. Users read
+    from the primary for REPLICA_STICKY_SECONDS after writing, in this
+    worker through memory and in the others through a cookie
+    """
+
+    def __init__(self, app=None):
+        """Initialising the router"""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Creates the replica engines and records writes of the app"""
+        db = app.extensions['sqlalchemy'].db
+        engines = [
+            db.make_engine(app, uri)
+            for uri in app.config.get('SQLALCHEMY_REPLICA_URIS') or ()]
+        app.extensions['replica_router'] = _ReplicaState(app, engines)
+        app.before_request(self.forget_replica)
+        app.after_request(self.stick_after_write)
+
+    @staticmethod
+    def _state():
+        """Returns the state of the current app"""
+        return current_app.extensions.get('replica_router')
+
+    @classmethod
+    def read_engine(cls, mapper=None):
+        """
+        Returns the replica to read from in the current request, None to
+        use the primary. The replica chosen first serves the whole request
+        """
+        state = cls._state()
+        if state is None or not state.replicas or \
+                not has_request_context() or \
+                request.method not in READ_METHODS:
+            return None
+        if mapper is not None and \
+                mapper.mapped_table.info.get('read_from_primary'):
+            return None
+        user_id = g.get('user_id')
+        if user_id is not None and state.is_sticky(user_id):
+            return None
+        try:
+            if float(request.cookies.get(STICKY_COOKIE, 0)) > time.time():
+                return None
+        except ValueError:
+            pass
+        if 'replica' not in g:
+            g.replica = state.choose()
+        return g.replica
+
+    @staticmethod
+    def forget_replica():
+        """Lets every request choose its replica and user afresh"""
+        g.pop('replica', None)
+        g.pop('user_id', None)
+
+    def stick_after_write(self, response):
+        """Keeps the user who made a successful write on the primary"""
+        state = self._state()
+        user_id = g.get('user_id')
+        if state.replicas and user_id is not None and \
+                request.method not in READ_METHODS + ('OPTIONS',) and \
+                response.status_code < 400:
+            until = state.stick(user_id)
+            response.set_cookie(
+                STICKY_COOKIE, str(until), max_age=state.sticky_seconds)
+        return response
+
+
+class RoutingSession(SignallingSession):
+    """Session reading from the replica the router picks, if any"""
+
+    def get_bind(self, mapper=None, clause=None):
+        """Returns the replica for reads it routes, else the primary"""
+        if not self._flushing:
+            engine = ReplicaRouter.read_engine(mapper)
+            if engine is not None:
+                return engine
+        return super().get_bind(mapper, clause)
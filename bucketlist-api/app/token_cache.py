@@ -0,0 +1,90 @@
+"""Module memoizes the claims of verified auth tokens"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from flask import current_app
+
+
+class _TokenCacheState:
+    """Least recently used verified tokens of one application"""
+
+    def __init__(self, size):
+        """Initialising the state"""
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+
+class TokenCache:
+    """
+    Bounded cache of the claims of verified tokens keyed by the token
+    digest, an entry expires with the token it was decoded from
+    """
+
+    def __init__(self, app=None):
+        """Initialising the cache"""
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Registers the cache state on the app"""
+        app.extensions['token_cache'] = _TokenCacheState(
+            app.config.get('TOKEN_CACHE_SIZE'))
+
+    @staticmethod
+    def _state():
+        """Returns the state of the current app"""
+        return current_app.extensions['token_cache']
+
+    @staticmethod
+    def _key(token):
+        """Returns the key a token is cached under"""
+        return hashlib.sha256(str(token).encode()).digest()
+
+    def get(self, token):
+        """Returns the cached claims of a token, None when not cached"""
+        state = self._state()
+        key = self._key(token)
+        with state.lock:
+            claims = state.entries.get(key)
+            if claims is not None and claims['exp'] <= time.time():
+                del state.entries[key]
+                claims = None
+            if claims is None:
+                state.misses += 1
+                return None
+            state.entries.move_to_end(key)
+            state.hits += 1
+            return claims
+
+    def set(self, token, claims):
+        """Caches the sub, exp and jti claims of a verified token"""
+        state = self._state()
+        if not state.size or 'exp' not in claims:
+            return
+        with state.lock:
+            state.entries[self._key(token)] = {
+                'sub': claims['sub'],
+                'exp': claims['exp'],
+                'jti': claims['jti']
+            }
+            while len(state.entries) > state.size:
+                state.entries.popitem(last=False)
+
+    def invalidate(self, token):
+        """Removes a token from the cache"""
+        state = self._state()
+        with state.lock:
+            state.entries.pop(self._key(token), None)
+
+    def stats(self):
+        """Returns the hit and miss counters and the number of entries"""
+        state = self._state()
+        return {
+            'hits': state.hits,
+            'misses': state.misses,
+            'size': len(state.entries)
+        }
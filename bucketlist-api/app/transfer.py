@@ -0,0 +1,305 @@
+"""Module imports and exports the bucketlists of a user"""
+import csv
+import datetime
+import io
+import json
+from sqlalchemy.exc import DBAPIError
+from app import db
+from app.models import Bucketlist, Item, insert_rows
+from app.renderers import dumps
+
+
+NAME_LENGTH = Bucketlist.__table__.c.name.type.length
+
+
+def _valid_name(name):
+    """
+    Returns whether name is a non-blank string that fits the name columns
+    and can be stored by PostgreSQL, which refuses NUL characters
+    """
+    return isinstance(name, str) and name.strip() != '' and \
+        len(name) <= NAME_LENGTH and \
+        len(''.join(name.lower().split())) <= NAME_LENGTH and \
+        '\x00' not in name
+
+
+def _valid_description(description):
+    """Returns whether description is None or a string PostgreSQL stores"""
+    return description is None or \
+        isinstance(description, str) and '\x00' not in description
+
+
+def parse_bucketlist(line):
+    """
+    Returns the name, description and items of the bucketlist a line
+    describes, raises ValueError when the line is not a valid bucketlist
+    """
+    data = json.loads(line)
+    if not isinstance(data, dict) or \
+            not _valid_name(data.get('name')) or \
+            'description' not in data or \
+            not _valid_description(data['description']):
+        raise ValueError('Invalid bucketlist')
+    items = data.get('items') or []
+    if isinstance(items, dict):
+        items = list(items.values())
+    if not isinstance(items, list) or not all(
+            isinstance(item, dict) and
+            _valid_name(item.get('name')) and
+            'description' in item and
+            _valid_description(item['description']) for item in items):
+        raise ValueError('Invalid items')
+    return data['name'], data['description'], items
+
+
+def _failure(number, message):
+    """Returns the error reported for a line that was not imported"""
+    return {'line': number, 'status': 'Failed', 'message': message}
+
+
+def _insert_batch(batch, owner_id, chunk_size):
+    """
+    Inserts a batch of parsed bucketlists and their items, returning the
+    errors of the lines that were not imported and the numbers of
+    bucketlists and items inserted. Bucketlists colliding with rows
+    written meanwhile fail on their own
+    """
+    errors = []
+    bucketlists = {}
+    for number, name, description, items in batch:
+        name_to_compare = ''.join(name.lower().split())
+        if name_to_compare in bucketlists:
+            errors.append(_failure(number, 'Bucketlist already exists'))
+            continue
+        unique_items = {}
+        for item in items:
+            unique_items.setdefault(
+                ''.join(item['name'].lower().split()), item)
+        bucketlists[name_to_compare] = (
+            number, name, description, unique_items)
+    existing = db.session.query(Bucketlist.name_to_compare).filter(
+        Bucketlist.owner == owner_id,
+        Bucketlist.name_to_compare.in_(list(bucketlists))
+    )
+    for (name_to_compare,) in existing:
+        number = bucketlists.pop(name_to_compare)[0]
+        errors.append(_failure(number, 'Bucketlist already exists'))
+    if not bucketlists:
+        return errors, 0, 0
+    now = datetime.datetime.utcnow()
+    pending = list(bucketlists.items())
+    failed = insert_rows(Bucketlist.__table__, [
+        {
+            'name': name,
+            'name_to_compare': name_to_compare,
+            'description': description,
+            'owner': owner_id,
+            'date_created': now,
+            'item_count': len(items),
+            'last_item_at': now if items else None
+        }
+        for name_to_compare, (_, name, description, items) in pending
+    ])
+    for position in failed:
+        name_to_compare, (number, _, _, _) = pending[position]
+        del bucketlists[name_to_compare]
+        errors.append(_failure(number, 'Bucketlist already exists'))
+    if not bucketlists:
+        return errors, 0, 0
+    ids = dict(db.session.query(
+        Bucketlist.name_to_compare, Bucketlist.id
+    ).filter(
+        Bucketlist.owner == owner_id,
+        Bucketlist.name_to_compare.in_(list(bucketlists))
+    ))
+    item_rows = [
+        {
+            'name': item['name'],
+            'name_to_compare': item_name_to_compare,
+            'description': item['description'],
+            'bucketlist_id': ids[name_to_compare]
+        }
+        for name_to_compare, (_, _, _, items) in bucketlists.items()
+        for item_name_to_compare, item in items.items()
+    ]
+    for start in range(0, len(item_rows), chunk_size):
+        db.session.execute(Item.__table__.insert().values(
+            item_rows[start:start + chunk_size]))
+    return errors, len(bucketlists), len(item_rows)
+
+
+def _write_batch(batch, owner_id, totals, chunk_size):
+    """
+    Writes a batch of parsed bucketlists and their items in a single
+    transaction, yielding an error for every line that was not imported.
+    When the database refuses the batch it is written again one line at
+    a time, each in a savepoint, so only the lines it refuses fail
+    """
+    errors = []
+    inserted = [0, 0]
+    try:
+        with db.session.begin_nested():
+            errors, bucketlists, items = _insert_batch(
+                batch, owner_id, chunk_size)
+        inserted = [bucketlists, items]
+    except DBAPIError as error:
+        if len(batch) == 1:
+            errors = [_failure(batch[0][0], str(error))]
+        else:
+            for entry in batch:
+                try:
+                    with db.session.begin_nested():
+                        line_errors, bucketlists, items = _insert_batch(
+                            [entry], owner_id, chunk_size)
+                except DBAPIError as line_error:
+                    errors.append(_failure(entry[0], str(line_error)))
+                    continue
+                errors.extend(line_errors)
+                inserted[0] += bucketlists
+                inserted[1] += items
+    db.session.commit()
+    yield from sorted(errors, key=lambda error: error['line'])
+    totals['bucketlists'] += inserted[0]
+    totals['items'] += inserted[1]
+
+
+def import_ndjson(lines, owner_id, batch_size, chunk_size=1000):
+    """
+    Imports one bucketlist with its items per line, writing batch_size
+    bucketlists per transaction. Yields an error for every line that is
+    not imported, the running totals after every batch and the final
+    totals, so only a single batch is ever held in memory. Item names
+    repeated within a bucketlist are imported once
+    """
+    totals = {'lines': 0, 'bucketlists': 0, 'items': 0}
+    batch = []
+    for number, line in enumerate(lines, 1):
+        totals['lines'] = number
+        try:
+            if isinstance(line, bytes):
+                line = line.decode('utf-8')
+            if not line.strip():
+                continue
+            batch.append((number,) + parse_bucketlist(line))
+        except ValueError as error:
+            yield {'line': number, 'status': 'Failed', 'message': str(error)}
+            continue
+        if len(batch) >= batch_size:
+            yield from _write_batch(batch, owner_id, totals, chunk_size)
+            yield dict(totals, status='Progress')
+            batch = []
+    if batch:
+        yield from _write_batch(batch, owner_id, totals, chunk_size)
+    yield dict(totals, status='Success')
+
+
+def _export_rows(owner_id, chunk_size):
+    """
+    Returns the bucketlists of a user joined with their items ordered by
+    bucketlist, streamed from a server-side cursor chunk_size rows at a time
+    """
+    return db.session.query(
+        Bucketlist.id,
+        Bucketlist.name,
+        Bucketlist.description,
+        Bucketlist.date_created,
+        Bucketlist.date_modified,
+        Item.id.label('item_id'),
+        Item.name.label('item_name'),
+        Item.description.label('item_description')
+    ).outerjoin(
+        Item, Item.bucketlist_id == Bucketlist.id
+    ).filter(
+        Bucketlist.owner == owner_id
+    ).order_by(
+        Bucketlist.id, Item.id
+    ).execution_options(stream_results=True).yield_per(chunk_size)
+
+
+def _buffered(chunks, size=8192):
+    """
+    Joins small chunks into chunks of about size characters, the first
+    chunk is passed on straight away to keep the time to first byte low
+    """
+    buffer = []
+    buffered = 0
+    first = True
+    for chunk in chunks:
+        if first:
+            first = False
+            yield chunk
+            continue
+        buffer.append(chunk)
+        buffered += len(chunk)
+        if buffered >= size:
+            yield ''.join(buffer)
+            buffer = []
+            buffered = 0
+    if buffer:
+        yield ''.join(buffer)
+
+
+def _isoformat(value):
+    """Returns a datetime as ISO 8601, None stays None"""
+    return value.isoformat() if value is not None else None
+
+
+def _ndjson_lines(owner_id, chunk_size):
+    """Yields a line per bucketlist with its items, in the import format"""
+    bucketlist = None
+    for row in _export_rows(owner_id, chunk_size):
+        if bucketlist is None or bucketlist['id'] != row.id:
+            if bucketlist is not None:
+                yield dumps(bucketlist) + '\n'
+            bucketlist = {
+                'id': row.id,
+                'name': row.name,
+                'description': row.description,
+                'date_created': _isoformat(row.date_created),
+                'date_modified': _isoformat(row.date_modified),
+                'items': []
+            }
+        if row.item_id is not None:
+            bucketlist['items'].append({
+                'id': row.item_id,
+                'name': row.item_name,
+                'description': row.item_description
+            })
+    if bucketlist is not None:
+        yield dumps(bucketlist) + '\n'
+
+
+def _csv_lines(owner_id, chunk_size):
+    """Yields a header and a line per item, or per bucketlist without items"""
+    line = io.StringIO()
+    writer = csv.writer(line)
+
+    def render(values):
+        """Returns values as a csv line"""
+        line.seek(0)
+        line.truncate()
+        writer.writerow(values)
+        return line.getvalue()
+
+    yield render([
+        'bucketlist_id', 'bucketlist_name', 'bucketlist_description',
+        'item_id', 'item_name', 'item_description'])
+    for row in _export_rows(owner_id, chunk_size):
+        yield render([
+            row.id, row.name, row.description,
+            row.item_id, row.item_name, row.item_description])
+
+
+EXPORT_FORMATS = {
+    'ndjson': ('application/x-ndjson', _ndjson_lines),
+    'csv': ('text/csv', _csv_lines)
+}
+
+
+def export_bucketlists(owner_id, export_format, chunk_size=1000):
+    """
+    Returns the mimetype and a generator of the text of all the
+    bucketlists of a user with their items in export_format
+    """
+    mimetype, lines = EXPORT_FORMATS[export_format]
+    return mimetype, _buffered(lines(owner_id, chunk_size))
@@ -1,7 +1,14 @@
 """Module for decorated functions"""
+import base64
+import binascii
+import hashlib
+import itertools
+import json
 from functools import wraps
-from flask import request, jsonify, make_response
-from .models import User
+from flask import (
+    request, make_response, current_app, g, Response, stream_with_context)
+from .models import User, Bucketlist, Item
+from .renderers import jsonify, dumps
 
 
 def auth_required(func):
@@ -20,14 +27,73 @@ def auth_required(func):
             auth_token = ''
         else:
             auth_token = auth_header.split(" ")[1]
-            resp = User.decode_auth_token(auth_token)
+            resp = User.decode_auth_payload(auth_token)
         if not auth_token or isinstance(resp, str):
             return make_response(jsonify(response)), code
-        user = {'user_id': resp, 'auth_token': auth_token}
+        user = {
+            'user_id': resp['sub'],
+            'auth_token': auth_token,
+            'token_id': resp['jti'],
+            'token_expires': resp['exp']
+        }
+        g.user_id = user['user_id']
         return func(user, *args, **kwargs)
     return decorated_function
 
 
+def make_etag(*parts):
+    """Returns an ETag for the parts of a validator and the request url"""
+    validator = ':'.join(str(part) for part in parts + (request.full_path,))
+    return hashlib.md5(validator.encode()).hexdigest()
+
+
+def not_modified(etag, last_modified=None):
+    """
+    Returns whether the client holds the current representation, going
+    by If-None-Match when it is sent and If-Modified-Since otherwise
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= \
+            request.if_modified_since
+    return False
+
+
+def set_validators(response, etag, last_modified=None):
+    """Sets the ETag and Last-Modified headers of a response"""
+    response.set_etag(etag)
+    if last_modified:
+        response.last_modified = last_modified
+    return response
+
+
+def conditional(validator):
+    """
+    Passing a function returning the parts of a cheap validator and the
+    last modification date of the resource, or None when there is none
+    """
+    def check_validator(func):
+        """Decorator answering 304 when the client copy is current"""
+        @wraps(func)
+        def conditional_function(user, *args, **kwargs):
+            """Decorated function skipping the view for current copies"""
+            state = validator(user, *args, **kwargs)
+            if state is None:
+                return func(user, *args, **kwargs)
+            parts, last_modified = state
+            etag = make_etag(*parts)
+            if not_modified(etag, last_modified):
+                return set_validators(
+                    Response(status=304), etag, last_modified)
+            response = make_response(func(user, *args, **kwargs))
+            if response.status_code == 200:
+                set_validators(response, etag, last_modified)
+            return response
+        return conditional_function
+    return check_validator
+
+
 def validate_fields(field1, field2):
     """Passing arguments to decorator"""
     def check_data(func):
@@ -46,3 +112,192 @@ def validate_fields(field1, field2):
             return func(*args, **kwargs)
         return validate_input_data
     return check_data
+
+
+def requested_fields(name, allowed):
+    """
+    Returns the comma separated fields of the name query parameter in
+    the order of allowed, None when it is missing. Raises ValueError for
+    fields that are not allowed
+    """
+    value = request.args.get(name)
+    if value is None:
+        return None
+    fields = {field.strip() for field in value.split(',') if field.strip()}
+    unknown = fields.difference(allowed)
+    if unknown:
+        raise ValueError('Unknown {}: {}'.format(
+            name, ', '.join(sorted(unknown))))
+    return tuple(field for field in allowed if field in fields)
+
+
+def fieldsets():
+    """
+    Returns the bucketlist fields and item fields asked for by the fields
+    and items_fields query parameters, None for those missing
+    """
+    return (
+        requested_fields('fields', Bucketlist.JSON_FIELDS),
+        requested_fields('items_fields', Item.JSON_FIELDS))
+
+
+def sparse_fieldsets(func):
+    """
+    Decorator rejecting requests for fields that do not exist, the view
+    finds the fields and item fields asked for in g.fieldsets
+    """
+    @wraps(func)
+    def validate_fieldsets(*args, **kwargs):
+        """Decorated function for validating the requested fields"""
+        try:
+            g.fieldsets = fieldsets()
+        except ValueError as error:
+            return make_response(
+                jsonify({
+                    'status': 'Failed',
+                    'message': str(error)
+                    })
+                ), 400
+        return func(*args, **kwargs)
+    return validate_fieldsets
+
+
+def validate_paging(func):
+    """
+    Decorator rejecting a limit or page that is not an integer of at
+    least 1. Cursor pages are also limited to MAX_PAGE_LIMIT rows, the
+    numbered pages keep taking any limit as they always have
+    """
+    @wraps(func)
+    def validate_limit_and_page(*args, **kwargs):
+        """Decorated function for validating the paging parameters"""
+        maximum = None
+        if cursor_requested():
+            maximum = current_app.config.get('MAX_PAGE_LIMIT')
+        for name, highest in (('limit', maximum), ('page', None)):
+            value = request.args.get(name)
+            if value is None:
+                continue
+            try:
+                number = int(value)
+            except ValueError:
+                number = 0
+            if number < 1 or (highest and number > highest):
+                return make_response(
+                    jsonify({
+                        'status': 'Failed',
+                        'message': 'Invalid {}'.format(name)
+                        })
+                    ), 400
+        return func(*args, **kwargs)
+    return validate_limit_and_page
+
+
+def encode_cursor(last_id):
+    """Returns an opaque cursor for the page following the row last_id"""
+    cursor = json.dumps({'after_id': last_id}).encode()
+    return base64.urlsafe_b64encode(cursor).decode()
+
+
+def decode_cursor(cursor):
+    """Returns the id a cursor points after, None if it is not valid"""
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+        return int(data['after_id'])
+    except (binascii.Error, ValueError, TypeError, KeyError):
+        return None
+
+
+def cursor_position():
+    """
+    Returns the id after which a cursor page starts, read from the
+    cursor or after_id query parameters, None if they are not valid.
+    An empty cursor starts from the first row
+    """
+    cursor = request.args.get('cursor')
+    if cursor is not None:
+        if not cursor:
+            return 0
+        return decode_cursor(cursor)
+    try:
+        return int(request.args.get('after_id'))
+    except (TypeError, ValueError):
+        return None
+
+
+def cursor_requested():
+    """Returns whether the request asks for cursor pagination"""
+    return 'cursor' in request.args or 'after_id' in request.args
+
+
+def keyset_page(query, column, position, limit=None):
+    """
+    Returns the rows of query following position when ordered by column,
+    and the cursor to the next page which is None on the last page.
+    Pages seek on the indexed column instead of using an offset
+    """
+    limit = max(int(limit or current_app.config.get('DEFAULT_PAGE_LIMIT')), 1)
+    rows = query.filter(column > position).order_by(column).limit(
+        limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(getattr(rows[-1], column.key))
+    return rows, next_cursor
+
+
+def iter_keyset(query, column, chunk_size, position=0):
+    """
+    Yields every row of query ordered by column following position,
+    fetched chunk_size rows at a time by seeking past the last row of the
+    previous chunk
+    """
+    while True:
+        rows = query.filter(column > position).order_by(column).limit(
+            chunk_size).all()
+        for row in rows:
+            yield row
+        if len(rows) < chunk_size:
+            return
+        position = getattr(rows[-1], column.key)
+
+
+def listing_response(query, column, render):
+    """
+    Returns the JSON array of render(row) for every row of query ordered
+    by column. It is streamed when the stream query parameter asks for it
+    or when there are more than STREAM_ROW_THRESHOLD rows, found out by
+    reading up to that many rows first rather than counting them
+    """
+    stream = request.args.get('stream')
+    chunk_size = current_app.config.get('STREAM_CHUNK_SIZE')
+    threshold = current_app.config.get('STREAM_ROW_THRESHOLD')
+    if stream is not None and stream.lower() in ('1', 'true', 'yes'):
+        return json_array_response(
+            iter_keyset(query, column, chunk_size), render)
+    if stream is not None or not threshold:
+        rows = query.order_by(column).all()
+        return make_response(jsonify([render(row) for row in rows])), 200
+    rows = query.order_by(column).limit(threshold + 1).all()
+    if len(rows) <= threshold:
+        return make_response(jsonify([render(row) for row in rows])), 200
+    remaining = iter_keyset(
+        query, column, chunk_size, getattr(rows[-1], column.key))
+    return json_array_response(itertools.chain(rows, remaining), render)
+
+
+def json_array_response(rows, render):
+    """
+    Returns a response streaming the JSON array of render(row) for every
+    row, encoding one element at a time so neither the objects nor the
+    document are ever held in memory as a whole
+    """
+    def generate():
+        """Yields the array one element at a time"""
+        separator = '['
+        for row in rows:
+            yield separator + dumps(render(row))
+            separator = ','
+        yield '[]' if separator == '[' else ']'
+    return Response(
+        stream_with_context(generate()), mimetype='application/json')
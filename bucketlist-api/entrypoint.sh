@@ -7,10 +7,6 @@ while ! netcat -z database 5432; do
 done
 
 echo "postgres started"
-python manage.py db init
-
-python manage.py db migrate
-
 python manage.py db upgrade
 
 python run.py
\ No newline at end of file
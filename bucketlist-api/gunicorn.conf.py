@@ -0,0 +1,27 @@
+"""gunicorn settings, used with gunicorn run:app --config gunicorn.conf.py"""
+import glob
+import os
+
+# threads for every hash the bcrypt pool may run or queue and four more,
+# so logins beyond BCRYPT_QUEUE_LIMIT reach the app and are answered 503
+# while other requests are still served, instead of waiting for a thread
+worker_class = 'gthread'
+threads = int(os.getenv(
+    'GUNICORN_THREADS',
+    int(os.getenv('BCRYPT_POOL_SIZE', 2)) +
+    int(os.getenv('BCRYPT_QUEUE_LIMIT', 8)) + 4))
+
+
+def on_starting(server):
+    """Clears the metrics files left behind by previous runs"""
+    path = os.environ.get('PROMETHEUS_MULTIPROC_DIR')
+    if path:
+        for metrics_file in glob.glob(os.path.join(path, '*.db')):
+            os.remove(metrics_file)
+
+
+def child_exit(server, worker):
+    """Drops the live gauges of a worker that exited"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+        multiprocess.mark_process_dead(worker.pid)
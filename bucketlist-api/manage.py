@@ -1,13 +1,73 @@
+import json
 import os
-from flask_script import Manager
+import sys
+from flask_script import Manager, Command, Option
 from flask_migrate import Migrate, MigrateCommand
 from app import db, create_app
+from app.hashing import calibrate_rounds
 from app.models import User, Bucketlist, BlacklistToken, Item
+from app.transfer import import_ndjson
 
 app = create_app(os.getenv('APP_SETTINGS'))
 migrate = Migrate(app, db)
 manager = Manager(app)
 manager.add_command('db', MigrateCommand)
 
+
+class ImportCommand(Command):
+    """Imports bucketlists with their items from a NDJSON file"""
+
+    option_list = (
+        Option('-u', '--username', dest='username', required=True,
+               help='user the bucketlists are imported for'),
+        Option('-f', '--file', dest='path', default='-',
+               help='NDJSON file to import, standard input by default'),
+        Option('-b', '--batch-size', dest='batch_size', type=int,
+               default=None, help='bucketlists written per transaction')
+    )
+
+    def run(self, username, path, batch_size):
+        """Imports the file reporting progress and failed lines"""
+        user = User.query.filter_by(username=username).first()
+        if not user:
+            print('Unknown user {}'.format(username), file=sys.stderr)
+            return 1
+        batch_size = batch_size or app.config.get('IMPORT_BATCH_SIZE')
+        lines = sys.stdin if path == '-' else open(path)
+        try:
+            for event in import_ndjson(
+                    lines, user.id, batch_size,
+                    app.config.get('ITEM_BATCH_LIMIT')):
+                if event['status'] == 'Failed':
+                    print(json.dumps(event), file=sys.stderr)
+                else:
+                    print(json.dumps(event))
+        finally:
+            if lines is not sys.stdin:
+                lines.close()
+
+
+manager.add_command('import', ImportCommand())
+
+
+@manager.option(
+    '-b', '--batch-size', dest='batch_size', type=int, default=1000,
+    help='number of tokens deleted per transaction')
+def purge_blacklist(batch_size):
+    """Deletes blacklisted tokens that have expired"""
+    purged = BlacklistToken.purge_expired(batch_size)
+    print('Purged {} expired tokens'.format(purged))
+
+
+@manager.option(
+    '-t', '--target-ms', dest='target_ms', type=int, default=None,
+    help='hash time to aim for, BCRYPT_TARGET_MS by default')
+def calibrate_bcrypt(target_ms):
+    """Prints the bcrypt cost that hashes within the target time"""
+    target_ms = target_ms or app.config.get('BCRYPT_TARGET_MS')
+    rounds = calibrate_rounds(target_ms)
+    print('BCRYPT_LOG_ROUNDS={}'.format(rounds))
+
+
 if __name__ == '__main__':
     manager.run()
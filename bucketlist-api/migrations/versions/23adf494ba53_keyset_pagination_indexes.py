@@ -0,0 +1,30 @@
+"""keyset pagination indexes
+
+Revision ID: 23adf494ba53
+Revises: da2b2c145438
+Create Date: 2026-10-18 10:03:57.218845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '23adf494ba53'
+down_revision = 'da2b2c145438'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(
+        'ix_bucketlists_owner_id', 'bucketlists', ['owner', 'id'],
+        unique=False)
+    op.create_index(
+        'ix_items_bucketlist_id_id', 'items', ['bucketlist_id', 'id'],
+        unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_items_bucketlist_id_id', table_name='items')
+    op.drop_index('ix_bucketlists_owner_id', table_name='bucketlists')
@@ -0,0 +1,48 @@
+"""per owner name indexes
+
+Revision ID: 4c2f1a9d7e3b
+Revises: fe89cfc49b06
+Create Date: 2026-10-18 19:12:05.481227
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c2f1a9d7e3b'
+down_revision = 'fe89cfc49b06'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # indexes are built CONCURRENTLY so the tables stay writable, which
+    # PostgreSQL only allows outside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(
+            'ix_bucketlists_owner_name_to_compare', 'bucketlists',
+            ['owner', 'name_to_compare'], unique=True,
+            postgresql_concurrently=True)
+        op.create_index(
+            'ix_items_bucketlist_id_name_to_compare', 'items',
+            ['bucketlist_id', 'name_to_compare'], unique=True,
+            postgresql_concurrently=True)
+    op.drop_constraint(
+        'bucketlists_name_to_compare_key', 'bucketlists', type_='unique')
+    op.drop_constraint(
+        'items_name_to_compare_key', 'items', type_='unique')
+
+
+def downgrade():
+    op.create_unique_constraint(
+        'items_name_to_compare_key', 'items', ['name_to_compare'])
+    op.create_unique_constraint(
+        'bucketlists_name_to_compare_key', 'bucketlists', ['name_to_compare'])
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            'ix_items_bucketlist_id_name_to_compare', table_name='items',
+            postgresql_concurrently=True)
+        op.drop_index(
+            'ix_bucketlists_owner_name_to_compare', table_name='bucketlists',
+            postgresql_concurrently=True)
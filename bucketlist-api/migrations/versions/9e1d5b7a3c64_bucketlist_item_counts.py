@@ -0,0 +1,38 @@
+"""bucketlist item counts
+
+Revision ID: 9e1d5b7a3c64
+Revises: 4c2f1a9d7e3b
+Create Date: 2026-10-18 20:31:47.902164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e1d5b7a3c64'
+down_revision = '4c2f1a9d7e3b'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'bucketlists',
+        sa.Column('item_count', sa.Integer(), nullable=False,
+                  server_default='0'))
+    op.add_column(
+        'bucketlists', sa.Column('last_item_at', sa.DateTime()))
+    # items have no creation date, the last change of the bucketlist is
+    # the closest to when its last item was added
+    op.execute(
+        'UPDATE bucketlists SET item_count = counts.item_count, '
+        'last_item_at = coalesce(date_modified, date_created) '
+        'FROM (SELECT bucketlist_id, count(*) AS item_count FROM items '
+        'GROUP BY bucketlist_id) AS counts '
+        'WHERE counts.bucketlist_id = bucketlists.id')
+
+
+def downgrade():
+    op.drop_column('bucketlists', 'last_item_at')
+    op.drop_column('bucketlists', 'item_count')
@@ -0,0 +1,82 @@
+"""compact expiring blacklist
+
+Revision ID: b720a3ea4a57
+Revises: bf889e5f3b71
+Create Date: 2026-10-18 13:41:08.530274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b720a3ea4a57'
+down_revision = 'bf889e5f3b71'
+branch_labels = None
+depends_on = None
+
+blacklist_token = sa.table(
+    'blacklist_token',
+    sa.column('id', sa.Integer),
+    sa.column('token', sa.String),
+    sa.column('jti', sa.String),
+    sa.column('expires_at', sa.DateTime)
+)
+
+
+def upgrade():
+    op.add_column(
+        'blacklist_token', sa.Column('jti', sa.String(length=64)))
+    op.add_column(
+        'blacklist_token', sa.Column('expires_at', sa.DateTime()))
+
+    # tokens issued before the jti claim are identified by their digest
+    # and expire with their exp claim, tokens that do not decode are
+    # treated as expired
+    op.execute('CREATE EXTENSION IF NOT EXISTS pgcrypto')
+    op.execute("""
+        CREATE FUNCTION pg_temp.token_expiry(token text)
+        RETURNS timestamp AS $$
+        DECLARE
+            payload text := translate(split_part(token, '.', 2), '-_', '+/');
+        BEGIN
+            RETURN to_timestamp((convert_from(decode(
+                payload || repeat('=', (4 - length(payload) % 4) % 4),
+                'base64'), 'UTF8')::json ->> 'exp')::double precision
+            ) AT TIME ZONE 'UTC';
+        EXCEPTION WHEN others THEN
+            RETURN now() AT TIME ZONE 'UTC';
+        END
+        $$ LANGUAGE plpgsql""")
+    op.execute(
+        "DELETE FROM blacklist_token "
+        "WHERE pg_temp.token_expiry(token) <= now() AT TIME ZONE 'UTC'")
+    op.execute(
+        "UPDATE blacklist_token "
+        "SET jti = encode(digest(token, 'sha256'), 'hex'), "
+        "expires_at = pg_temp.token_expiry(token)")
+
+    op.alter_column('blacklist_token', 'jti', nullable=False)
+    op.alter_column('blacklist_token', 'expires_at', nullable=False)
+    op.create_unique_constraint(
+        'blacklist_token_jti_key', 'blacklist_token', ['jti'])
+    op.create_index(
+        'ix_blacklist_token_expires_at', 'blacklist_token', ['expires_at'],
+        unique=False)
+    op.drop_column('blacklist_token', 'token')
+
+
+def downgrade():
+    # revoked tokens can not be recovered from their identifiers
+    op.execute(blacklist_token.delete())
+    op.add_column(
+        'blacklist_token',
+        sa.Column('token', sa.String(), nullable=False))
+    op.create_unique_constraint(
+        'blacklist_token_token_key', 'blacklist_token', ['token'])
+    op.drop_index(
+        'ix_blacklist_token_expires_at', table_name='blacklist_token')
+    op.drop_constraint(
+        'blacklist_token_jti_key', 'blacklist_token', type_='unique')
+    op.drop_column('blacklist_token', 'expires_at')
+    op.drop_column('blacklist_token', 'jti')
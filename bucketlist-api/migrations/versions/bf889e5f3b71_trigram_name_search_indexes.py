@@ -0,0 +1,33 @@
+"""trigram name search indexes
+
+Revision ID: bf889e5f3b71
+Revises: 23adf494ba53
+Create Date: 2026-10-18 11:26:40.915372
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'bf889e5f3b71'
+down_revision = '23adf494ba53'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    op.create_index(
+        'ix_bucketlists_name_trgm', 'bucketlists', ['name'],
+        unique=False, postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'})
+    op.create_index(
+        'ix_items_name_trgm', 'items', ['name'],
+        unique=False, postgresql_using='gin',
+        postgresql_ops={'name': 'gin_trgm_ops'})
+
+
+def downgrade():
+    op.drop_index('ix_items_name_trgm', table_name='items')
+    op.drop_index('ix_bucketlists_name_trgm', table_name='bucketlists')
@@ -0,0 +1,70 @@
+"""initial schema
+
+Revision ID: da2b2c145438
+Revises: 
+Create Date: 2026-10-18 09:12:31.402118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'da2b2c145438'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table(
+        'blacklist_token',
+        sa.Column('id', sa.Integer(), autoincrement=True, nullable=False),
+        sa.Column('token', sa.String(), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('token')
+    )
+    op.create_table(
+        'users',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('firstname', sa.String(length=256), nullable=False),
+        sa.Column('lastname', sa.String(length=256), nullable=False),
+        sa.Column('username', sa.String(length=256), nullable=False),
+        sa.Column('password', sa.String(length=256), nullable=False),
+        sa.Column('email', sa.String(length=256), nullable=False),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('email'),
+        sa.UniqueConstraint('username')
+    )
+    op.create_table(
+        'bucketlists',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name_to_compare', sa.String(length=256), nullable=False),
+        sa.Column('name', sa.String(length=256), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('date_created', sa.DateTime(), nullable=True),
+        sa.Column('date_modified', sa.DateTime(), nullable=True),
+        sa.Column('owner', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['owner'], ['users.id'], ondelete='cascade'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name_to_compare')
+    )
+    op.create_table(
+        'items',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('name', sa.String(length=256), nullable=False),
+        sa.Column('name_to_compare', sa.String(length=256), nullable=False),
+        sa.Column('description', sa.Text(), nullable=True),
+        sa.Column('bucketlist_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(
+            ['bucketlist_id'], ['bucketlists.id'], ondelete='cascade'),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('name_to_compare')
+    )
+
+
+def downgrade():
+    op.drop_table('items')
+    op.drop_table('bucketlists')
+    op.drop_table('users')
+    op.drop_table('blacklist_token')
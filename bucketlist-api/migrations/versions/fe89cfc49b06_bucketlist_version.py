@@ -0,0 +1,27 @@
+"""bucketlist version
+
+Revision ID: fe89cfc49b06
+Revises: b720a3ea4a57
+Create Date: 2026-10-18 16:02:44.117903
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'fe89cfc49b06'
+down_revision = 'b720a3ea4a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        'bucketlists',
+        sa.Column('version', sa.Integer(), nullable=False,
+                  server_default='1'))
+
+
+def downgrade():
+    op.drop_column('bucketlists', 'version')
@@ -1,6 +1,107 @@
 """Module contains the base Test class for the app"""
+import copy
+import functools
+import os
 from flask_testing import TestCase
-from app import db, create_app
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine.url import make_url
+from app import db, create_app, revocations, token_cache
+
+# 'rollback' creates the schema once per process and rolls every test
+# back to a savepoint, 'recreate' creates and drops it around every test
+ISOLATION = os.getenv('TEST_DB_ISOLATION', 'rollback')
+
+_app = None
+_app_state = None
+
+
+@functools.lru_cache()
+def worker_database_uri(uri):
+    """
+    Returns the database of this test process, a database per worker when
+    the suite runs on several with pytest -n, created when missing
+    """
+    worker = os.getenv('PYTEST_XDIST_WORKER')
+    if not worker:
+        return uri
+    url = make_url(uri)
+    name = '{}_{}'.format(url.database, worker)
+    server_url = copy.copy(url)
+    server_url.database = 'postgres'
+    server = create_engine(server_url)
+    try:
+        with server.connect().execution_options(
+                isolation_level='AUTOCOMMIT') as connection:
+            exists = connection.execute(
+                text('SELECT 1 FROM pg_database WHERE datname = :name'),
+                name=name).scalar()
+            if not exists:
+                connection.execute('CREATE DATABASE "{}"'.format(name))
+    finally:
+        server.dispose()
+    url.database = name
+    return str(url)
+
+
+def copy_hooks(hooks):
+    """Returns a copy of the request hooks of an app by blueprint"""
+    return {blueprint: list(funcs) for blueprint, funcs in hooks.items()}
+
+
+def restart_savepoint(session, transaction):
+    """Starts a new savepoint whenever a test ends one"""
+    if transaction.nested and not transaction._parent.nested:
+        session.expire_all()
+        session.begin_nested()
+
+
+def cached_app():
+    """
+    Returns the app of this process, creating it and its schema on the
+    first call
+    """
+    global _app, _app_state
+    if _app is None:
+        app = create_app(config_name='testing')
+        app.config['SQLALCHEMY_DATABASE_URI'] = worker_database_uri(
+            app.config['SQLALCHEMY_DATABASE_URI'])
+        with app.app_context():
+            db.drop_all()
+            db.create_all()
+            db.session.remove()
+        _app = app
+        _app_state = {
+            'config': dict(app.config),
+            'extensions': dict(app.extensions),
+            'hooks': {
+                name: copy_hooks(getattr(app, name))
+                for name in (
+                    'before_request_funcs', 'after_request_funcs',
+                    'teardown_request_funcs')}
+        }
+    return _app
+
+
+def reset_app(app):
+    """Undoes what a test changed on the cached app"""
+    app.config.clear()
+    app.config.update(_app_state['config'])
+    app.extensions.clear()
+    app.extensions.update(_app_state['extensions'])
+    for name, hooks in _app_state['hooks'].items():
+        setattr(app, name, copy_hooks(hooks))
+    token_cache.init_app(app)
+    revocations.init_app(app)
+
+
+def reset_sequences(connection):
+    """Makes the next id of every table 1 again, as tests expect"""
+    for table in db.metadata.sorted_tables:
+        if 'id' in table.c:
+            connection.execute(
+                text("SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                     "1, false)"),
+                table=table.name)
 
 
 class BaseTestCase(TestCase):
@@ -8,18 +109,43 @@ class BaseTestCase(TestCase):
 
     def create_app(self):
         """Method creates app for testing purposes"""
-        app = create_app(config_name='testing')
-        return app
+        if ISOLATION == 'recreate':
+            app = create_app(config_name='testing')
+            app.config['SQLALCHEMY_DATABASE_URI'] = worker_database_uri(
+                app.config['SQLALCHEMY_DATABASE_URI'])
+            return app
+        return cached_app()
 
     def setUp(self):
         """Method executed before every test to setup the test database"""
-        db.create_all()
-        db.session.commit()
+        if ISOLATION == 'recreate':
+            db.create_all()
+            db.session.commit()
+            return
+        self.connection = db.engine.connect()
+        self.transaction = self.connection.begin()
+        reset_sequences(self.connection)
+        self.session = db.create_scoped_session(
+            options={'bind': self.connection, 'binds': {}})
+        self.original_session = db.session
+        db.session = self.session
+        self.session.begin_nested()
+        event.listen(
+            self.session(), 'after_transaction_end', restart_savepoint)
 
     def tearDown(self):
         """
         Method executed at the end of every test
         so as to clear the database for the next test
         """
-        db.session.remove()
-        db.drop_all()
+        if ISOLATION == 'recreate':
+            db.session.remove()
+            db.drop_all()
+            return
+        event.remove(
+            self.session(), 'after_transaction_end', restart_savepoint)
+        self.session.remove()
+        db.session = self.original_session
+        self.transaction.rollback()
+        self.connection.close()
+        reset_app(self.app)
@@ -0,0 +1,79 @@
+"""
+Bandwidth and latency benchmark of compressed responses, run against the
+testing database with
+
+    python -m tests.benchmarks.bench_compression --bucketlists 500 --items 10
+
+The transfer time of every body is estimated at --mbps, so the time spent
+compressing can be weighed against the time saved on the wire
+"""
+import argparse
+import time
+from app import create_app, db
+from app.compression import brotli
+from app.models import User
+from .seed import seed
+
+
+def measure(client, url, auth_token, encoding, repeat):
+    """Returns the best seconds and the body bytes of a GET request"""
+    headers = dict(Authorization='Bearer ' + auth_token)
+    if encoding:
+        headers['Accept-Encoding'] = encoding
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        response = client.get(url, headers=headers, buffered=False)
+        size = sum(len(chunk) for chunk in response.response)
+        response.close()
+        timings.append(time.perf_counter() - started)
+    return min(timings), size
+
+
+def main():
+    """Seeds one user and compares every encoding on a few endpoints"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bucketlists', type=int, default=500)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--mbps', type=float, default=10.0)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    encodings = ['', 'gzip'] + (['br'] if brotli is not None else [])
+    urls = [
+        '/v1/bucketlists?limit=20',
+        '/v1/bucketlists?stream=false',
+        '/v1/bucketlists?stream=true',
+        '/v1/bucketlists/export?format=ndjson',
+    ]
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            user_id = seed(1, args.bucketlists, args.items)[0]
+            user = User.query.get(user_id)
+            auth_token = user.encode_auth_token(user_id).decode()
+            client = app.test_client()
+            print('{:<38} {:<9} {:>10} {:>7} {:>9} {:>10}'.format(
+                'url', 'encoding', 'bytes', 'ratio', 'server s',
+                'total s'))
+            for url in urls:
+                identity = None
+                for encoding in encodings:
+                    elapsed, size = measure(
+                        client, url, auth_token, encoding, args.repeat)
+                    identity = identity or size
+                    transfer = size * 8 / (args.mbps * 10 ** 6)
+                    print('{:<38} {:<9} {:>10} {:>7.2f} {:>9.3f} '
+                          '{:>10.3f}'.format(
+                              url, encoding or 'identity', size,
+                              identity / size, elapsed,
+                              elapsed + transfer))
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
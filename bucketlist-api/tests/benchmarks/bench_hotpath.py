@@ -0,0 +1,204 @@
+"""
+Micro-benchmarks of the functions every request goes through, run
+against the testing database with
+
+    python -m tests.benchmarks.bench_hotpath --save baseline_hotpath.json
+
+and compared with a saved baseline, failing on regressions, with
+
+    python -m tests.benchmarks.bench_hotpath --compare baseline_hotpath.json
+
+Allocations are exact and fail beyond --tolerance. Speeds are
+normalized by a fixed reference workload timed in the same run, which
+evens out small changes in load but not different hardware, so they get
+the wider --speed-tolerance and baselines are only compared on the
+machine that saved them. CI runs tests/benchmarks/compare_hotpath.sh,
+which benchmarks the parent commit as the baseline on the same runner.
+No baseline is committed, so a slowdown spread over several commits,
+each within the tolerance, goes unnoticed there
+"""
+import argparse
+import datetime
+import json
+import sys
+import timeit
+import tracemalloc
+from app import create_app, db, token_cache
+from app.models import User, Bucketlist, Item
+from app.renderers import jsonify
+from app.utils import auth_required, validate_fields
+
+
+def reference_workload():
+    """A fixed mix of arithmetic, string and dict work"""
+    data = {str(number): number * 2 for number in range(200)}
+    return json.dumps(data, sort_keys=True)
+
+
+def best_seconds(func, repeat, min_time):
+    """
+    Returns the best seconds per call over repeat runs each taking at
+    least min_time seconds
+    """
+    timer = timeit.Timer(func)
+    number, elapsed = timer.autorange()
+    if elapsed < min_time:
+        number = int(number * min_time / max(elapsed, 1e-9)) + 1
+    return min(timer.repeat(repeat, number)) / number
+
+
+def peak_bytes(func):
+    """Returns the peak memory allocated by one call"""
+    func()
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bucketlist_with_items(number, items):
+    """Returns an unsaved bucketlist with items"""
+    now = datetime.datetime.utcnow()
+    bucketlist = Bucketlist(
+        'List {}'.format(number), 'Things to do, list {}'.format(number), 1)
+    bucketlist.id = number + 1
+    bucketlist.date_created = now
+    bucketlist.date_modified = now
+    for item_number in range(items):
+        item = Item(
+            'Item {}'.format(item_number),
+            'Something worth doing, item {}'.format(item_number),
+            bucketlist.id)
+        item.id = number * items + item_number + 1
+        bucketlist.items.append(item)
+    return bucketlist
+
+
+def cases(app):
+    """Returns the name and the function of every benchmark"""
+    user = User.query.first()
+    token = user.encode_auth_token(user.id).decode()
+    headers = {'Authorization': 'Bearer ' + token}
+    authenticated = auth_required(lambda user: user)
+    validated = validate_fields('name', 'description')(lambda: None)
+
+    def decode_uncached():
+        """Decodes a token the cache does not hold"""
+        token_cache.invalidate(token)
+        return User.decode_auth_token(token)
+
+    def in_request(func, **kwargs):
+        """Returns func called within a request to the app"""
+        def call():
+            """Calls func within the request"""
+            with app.test_request_context(**kwargs):
+                return func()
+        return call
+
+    result = [
+        ('encode_auth_token', lambda: user.encode_auth_token(user.id)),
+        ('decode_auth_token', lambda: User.decode_auth_token(token)),
+        ('decode_auth_token_uncached', decode_uncached),
+        ('auth_required', in_request(authenticated, headers=headers)),
+        ('validate_fields', in_request(
+            validated, method='POST', content_type='application/json',
+            data=json.dumps({'name': 'List', 'description': 'To do'}))),
+        ('item_to_json', bucketlist_with_items(0, 1).items[0].to_json),
+    ]
+    for items in (0, 10, 100):
+        bucketlist = bucketlist_with_items(0, items)
+        result.append((
+            'bucketlist_to_json_{}_items'.format(items), bucketlist.to_json))
+    page = [bucketlist_with_items(number, 10) for number in range(20)]
+    result.append(('jsonify_20_bucketlists', in_request(
+        lambda: jsonify([bucketlist.to_json() for bucketlist in page]))))
+    return result
+
+
+def measure(app, repeat, min_time):
+    """Returns the speed and allocations of every benchmark"""
+    reference = best_seconds(reference_workload, repeat, min_time)
+    results = {}
+    for name, func in cases(app):
+        seconds = best_seconds(func, repeat, min_time)
+        results[name] = {
+            'ops_per_sec': 1 / seconds,
+            'relative_speed': reference / seconds,
+            'peak_bytes': peak_bytes(func)
+        }
+    return {'reference_seconds': reference, 'results': results}
+
+
+def compare(current, baseline, tolerance, speed_tolerance):
+    """
+    Prints every benchmark against its baseline, returns the names of
+    those allocating more than tolerance or slower than speed_tolerance
+    allows
+    """
+    regressions = []
+    print('{:<30} {:>12} {:>9} {:>12} {:>9}'.format(
+        'benchmark', 'ops/sec', 'speed', 'peak bytes', 'memory'))
+    for name, stats in current['results'].items():
+        base = baseline['results'].get(name)
+        if base is None:
+            print('{:<30} {:>12.0f} {:>9} {:>12} {:>9}'.format(
+                name, stats['ops_per_sec'], 'new', stats['peak_bytes'],
+                'new'))
+            continue
+        speed = stats['relative_speed'] / base['relative_speed'] - 1
+        memory = stats['peak_bytes'] / max(base['peak_bytes'], 1) - 1
+        print('{:<30} {:>12.0f} {:>+8.1%} {:>12} {:>+8.1%}'.format(
+            name, stats['ops_per_sec'], speed, stats['peak_bytes'], memory))
+        if speed < -speed_tolerance or memory > tolerance:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    """Runs the benchmarks, saving or comparing them"""
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawTextHelpFormatter)
+    parser.add_argument('--save', help='file to write the results to')
+    parser.add_argument('--compare', help='baseline file to compare with')
+    parser.add_argument(
+        '--tolerance', type=float, default=0.2,
+        help='fraction the peak allocations of a benchmark may grow by')
+    parser.add_argument(
+        '--speed-tolerance', type=float, default=0.5,
+        help='fraction a benchmark may slow down by')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.2)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    app.config['TOKEN_TIME'] = 3600
+    app.config['SECRET'] = app.config['SECRET'] or 'benchmark-secret'
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            db.session.add(User('Bench', 'Mark', 'bench', 'pass', 'b@b.com'))
+            db.session.commit()
+            current = measure(app, args.repeat, args.min_time)
+        finally:
+            db.session.remove()
+            db.drop_all()
+    baseline = {'results': {}}
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+    regressions = compare(
+        current, baseline, args.tolerance, args.speed_tolerance)
+    if args.save:
+        with open(args.save, 'w') as output:
+            json.dump(current, output, indent=2, sort_keys=True)
+    if regressions:
+        print('Allocating over {:.0%} more or over {:.0%} slower: {}'.format(
+            args.tolerance, args.speed_tolerance, ', '.join(regressions)))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
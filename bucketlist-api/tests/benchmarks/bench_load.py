@@ -0,0 +1,313 @@
+"""
+Load benchmark driving a mix of logins, listings, searches, pages and
+bucketlist changes through the app, in process by default
+
+    python -m tests.benchmarks.bench_load --users 10 --bucketlists 50 \
+        --items 10 --requests 2000 --concurrency 8 --output baseline.json
+
+Seeding drops every table first, configurations other than testing need
+--force. It runs against a running server seeded by tests.benchmarks.seed
+with
+
+    python -m tests.benchmarks.bench_load --url http://localhost:5000 \
+        --no-seed --users 10
+
+It prints the p50, p95 and p99 latencies and requests per second of
+every operation and writes them as JSON with --output
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from app import create_app, db
+from .seed import check_disposable, seed
+
+# relative frequency of every operation in the mix
+MIX = {
+    'login': 2,
+    'list': 25,
+    'search': 15,
+    'paginate': 20,
+    'page': 10,
+    'get': 10,
+    'create': 8,
+    'edit': 5,
+    'delete': 5
+}
+
+
+class LocalClient:
+    """Sends requests to the app in this process"""
+
+    def __init__(self, app):
+        """Initialising the client"""
+        self.client = app.test_client()
+
+    def request(self, method, path, token=None, body=None):
+        """Returns the status and the JSON of a response"""
+        headers = {'Authorization': 'Bearer ' + token} if token else {}
+        response = self.client.open(
+            path, method=method, headers=headers,
+            data=json.dumps(body) if body is not None else None,
+            content_type='application/json')
+        data = response.get_data()
+        return response.status_code, json.loads(data.decode()) \
+            if data else None
+
+
+class HttpClient:
+    """Sends requests to a running server"""
+
+    def __init__(self, url):
+        """Initialising the client"""
+        import requests
+        self.url = url.rstrip('/')
+        self.session = requests.Session()
+
+    def request(self, method, path, token=None, body=None):
+        """Returns the status and the JSON of a response"""
+        headers = {'Authorization': 'Bearer ' + token} if token else {}
+        response = self.session.request(
+            method, self.url + path, headers=headers, json=body)
+        return response.status_code, response.json() \
+            if response.content else None
+
+
+class Worker:
+    """A user sending requests in the proportions of MIX"""
+
+    def __init__(self, client, username, password, results, rng):
+        """Initialising the worker"""
+        self.client = client
+        self.username = username
+        self.password = password
+        self.results = results
+        self.rng = rng
+        self.token = None
+        self.bucketlist_ids = []
+        self.created = 0
+
+    def timed(self, operation, method, path, body=None, token=True):
+        """Sends a request, recording its latency under operation"""
+        started = time.perf_counter()
+        status, data = self.client.request(
+            method, path, self.token if token else None, body)
+        elapsed = time.perf_counter() - started
+        self.results.record(operation, elapsed, status < 400)
+        return status, data
+
+    def login(self):
+        """Logs in and learns the ids of the first bucketlists"""
+        _, data = self.timed('login', 'POST', '/v1/auth/login', {
+            'username': self.username,
+            'password': self.password
+        }, token=False)
+        if not data or 'auth_token' not in data:
+            raise RuntimeError('{} could not log in: {}'.format(
+                self.username, data))
+        self.token = data['auth_token']
+        _, data = self.timed(
+            'paginate', 'GET', '/v1/bucketlists?cursor=&limit=50')
+        self.bucketlist_ids = [item['id'] for item in data['items']]
+
+    def run(self, operation):
+        """Sends one request of an operation"""
+        rng = self.rng
+        if operation == 'login' or self.token is None:
+            return self.login()
+        if operation in ('get', 'edit', 'delete') and \
+                not self.bucketlist_ids:
+            operation = 'create'
+        if operation == 'list':
+            status, _ = self.timed('list', 'GET', '/v1/bucketlists?limit=20')
+        elif operation == 'search':
+            status, _ = self.timed(
+                'search', 'GET',
+                '/v1/bucketlists?q=List {}'.format(rng.randint(0, 9)))
+        elif operation == 'paginate':
+            status, _ = self.timed(
+                'paginate', 'GET', '/v1/bucketlists?cursor=&limit=20')
+        elif operation == 'page':
+            status, _ = self.timed(
+                'page', 'GET',
+                '/v1/bucketlists?page={}&limit=10'.format(rng.randint(1, 3)))
+        elif operation == 'get':
+            status, _ = self.timed(
+                'get', 'GET', '/v1/bucketlists/{}'.format(
+                    rng.choice(self.bucketlist_ids)))
+        elif operation == 'create':
+            self.created += 1
+            status, data = self.timed('create', 'POST', '/v1/bucketlists', {
+                'name': 'Load {} {}'.format(self.username, self.created),
+                'description': 'Created under load'
+            })
+            if status == 201:
+                self.bucketlist_ids.append(data['id'])
+        elif operation == 'edit':
+            self.created += 1
+            status, _ = self.timed(
+                'edit', 'PUT', '/v1/bucketlists/{}'.format(
+                    rng.choice(self.bucketlist_ids)), {
+                        'name': 'Edited {} {}'.format(
+                            self.username, self.created),
+                        'description': 'Edited under load'
+                    })
+        else:
+            bucketlist_id = self.bucketlist_ids.pop(
+                rng.randrange(len(self.bucketlist_ids)))
+            status, _ = self.timed(
+                'delete', 'DELETE', '/v1/bucketlists/{}'.format(
+                    bucketlist_id))
+        if status == 401:
+            # the token expired, log in again before the next request
+            self.token = None
+
+
+class Results:
+    """Latencies and failures of every operation"""
+
+    def __init__(self):
+        """Initialising the results"""
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.failures = {}
+
+    def record(self, operation, elapsed, ok):
+        """Records a request of an operation"""
+        with self.lock:
+            self.latencies.setdefault(operation, []).append(elapsed)
+            if not ok:
+                self.failures[operation] = \
+                    self.failures.get(operation, 0) + 1
+
+    def summary(self, wall_time):
+        """Returns the percentiles and throughput of every operation"""
+        def percentile(latencies, fraction):
+            """Returns a nearest rank percentile in milliseconds"""
+            if not latencies:
+                return 0.0
+            index = max(int(round(fraction * len(latencies))) - 1, 0)
+            return latencies[index] * 1000
+
+        summary = {}
+        every = []
+        for operation, latencies in sorted(self.latencies.items()):
+            latencies = sorted(latencies)
+            every.extend(latencies)
+            summary[operation] = {
+                'requests': len(latencies),
+                'failures': self.failures.get(operation, 0),
+                'p50_ms': percentile(latencies, .50),
+                'p95_ms': percentile(latencies, .95),
+                'p99_ms': percentile(latencies, .99),
+                'rps': len(latencies) / wall_time
+            }
+        every.sort()
+        summary['total'] = {
+            'requests': len(every),
+            'failures': sum(self.failures.values()),
+            'p50_ms': percentile(every, .50),
+            'p95_ms': percentile(every, .95),
+            'p99_ms': percentile(every, .99),
+            'rps': len(every) / wall_time
+        }
+        return summary
+
+
+def drive(make_client, usernames, password, requests, concurrency, seed_):
+    """Runs requests spread over concurrency threads, returns the results"""
+    results = Results()
+    operations = list(MIX)
+    weights = [MIX[operation] for operation in operations]
+    per_thread = requests // concurrency
+
+    def work(number):
+        """Sends the requests of one thread as one user"""
+        rng = random.Random(seed_ + number)
+        worker = Worker(
+            make_client(), usernames[number % len(usernames)], password,
+            results, rng)
+        for _ in range(per_thread):
+            operation = rng.choices(operations, weights)[0]
+            worker.run(operation)
+
+    threads = [
+        threading.Thread(target=work, args=(number,))
+        for number in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results.summary(time.perf_counter() - started)
+
+
+def report(summary):
+    """Prints the summary as a table"""
+    print('{:<10} {:>9} {:>9} {:>9} {:>9} {:>9} {:>9}'.format(
+        'operation', 'requests', 'failures', 'p50 ms', 'p95 ms', 'p99 ms',
+        'rps'))
+    for operation, stats in summary.items():
+        print('{:<10} {:>9} {:>9} {:>9.2f} {:>9.2f} {:>9.2f} {:>9.1f}'.format(
+            operation, stats['requests'], stats['failures'],
+            stats['p50_ms'], stats['p95_ms'], stats['p99_ms'],
+            stats['rps']))
+
+
+def main():
+    """Seeds the database, drives the mix and reports the results"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--url')
+    parser.add_argument('--no-seed', action='store_true')
+    parser.add_argument(
+        '--force', action='store_true',
+        help='drop the tables of a configuration other than testing')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--bucketlists', type=int, default=50)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--password', default='pass')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output')
+    args = parser.parse_args()
+    if not args.no_seed:
+        check_disposable(parser, args)
+
+    app = create_app(args.config)
+    # testing tokens expire within seconds, long enough for one run
+    app.config['TOKEN_TIME'] = 3600
+    usernames = ['user{}'.format(number) for number in range(args.users)]
+    with app.app_context():
+        if not args.no_seed:
+            db.drop_all()
+            db.create_all()
+            seed(args.users, args.bucketlists, args.items, args.password)
+            db.session.remove()
+    if args.url:
+        def make_client():
+            """Returns a client of the server"""
+            return HttpClient(args.url)
+    else:
+        def make_client():
+            """Returns a client of the app"""
+            return LocalClient(app)
+    summary = drive(
+        make_client, usernames, args.password, args.requests,
+        args.concurrency, args.seed)
+    report(summary)
+    if args.output:
+        with open(args.output, 'w') as output:
+            json.dump({
+                'benchmark': 'load',
+                'parameters': {
+                    key: value for key, value in vars(args).items()
+                    if key != 'output'},
+                'results': summary
+            }, output, indent=2, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
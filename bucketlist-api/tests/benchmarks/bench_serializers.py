@@ -0,0 +1,66 @@
+"""
+Micro-benchmark of the JSON renderers over Bucketlist.to_json output,
+needs no database and runs with
+
+    python -m tests.benchmarks.bench_serializers --bucketlists 200 --items 10
+"""
+import argparse
+import datetime
+import timeit
+from app import create_app
+from app.models import Bucketlist, Item
+from app.renderers import RENDERERS, orjson
+
+
+def payload(bucketlists, items):
+    """Returns the to_json output of a page of bucketlists with items"""
+    now = datetime.datetime.utcnow()
+    page = []
+    for number in range(bucketlists):
+        bucketlist = Bucketlist(
+            'List {}'.format(number),
+            'Things to do, list {}'.format(number),
+            1)
+        bucketlist.id = number + 1
+        bucketlist.date_created = now
+        bucketlist.date_modified = now
+        for item_number in range(items):
+            item = Item(
+                'Item {}'.format(item_number),
+                'Something worth doing, item {}'.format(item_number),
+                bucketlist.id)
+            item.id = number * items + item_number + 1
+            bucketlist.items.append(item)
+        page.append(bucketlist.to_json())
+    return page
+
+
+def main():
+    """Times jsonify and dumps of every installed renderer"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bucketlists', type=int, default=200)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument('--number', type=int, default=50)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    names = ['stdlib'] + (['orjson'] if orjson is not None else [])
+    with app.test_request_context():
+        data = payload(args.bucketlists, args.items)
+        print('{:<8} {:<8} {:>12} {:>10}'.format(
+            'renderer', 'call', 'ms per call', 'bytes'))
+        for name in names:
+            renderer = RENDERERS[name](app)
+            for call in ('jsonify', 'dumps'):
+                func = getattr(renderer, call)
+                elapsed = timeit.timeit(
+                    lambda: func(data), number=args.number)
+                output = func(data)
+                size = len(output.get_data()) if call == 'jsonify' \
+                    else len(output.encode())
+                print('{:<8} {:<8} {:>12.3f} {:>10}'.format(
+                    name, call, elapsed / args.number * 1000, size))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,60 @@
+"""
+Memory benchmark of the buffered and the streamed bucketlist listing,
+run against the testing database with
+
+    python -m tests.benchmarks.bench_streaming --bucketlists 2000 --items 10
+"""
+import argparse
+import time
+import tracemalloc
+from app import create_app, db
+from app.models import User
+from .seed import seed
+
+
+def measure(client, url, auth_token):
+    """Returns the peak memory, seconds and bytes of a GET request"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    response = client.get(
+        url,
+        headers=dict(Authorization='Bearer ' + auth_token),
+        buffered=False)
+    size = sum(len(chunk) for chunk in response.response)
+    response.close()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return peak, elapsed, size
+
+
+def main():
+    """Seeds one user and compares both listing modes"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--bucketlists', type=int, default=2000)
+    parser.add_argument('--items', type=int, default=10)
+    args = parser.parse_args()
+
+    app = create_app('testing')
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        try:
+            user_id = seed(1, args.bucketlists, args.items)[0]
+            user = User.query.get(user_id)
+            auth_token = user.encode_auth_token(user_id).decode()
+            client = app.test_client()
+            print('{:<10} {:>12} {:>10} {:>12}'.format(
+                'mode', 'peak MiB', 'seconds', 'bytes'))
+            for mode, stream in (('buffered', 'false'), ('streamed', 'true')):
+                peak, elapsed, size = measure(
+                    client, '/v1/bucketlists?stream=' + stream, auth_token)
+                print('{:<10} {:>12.2f} {:>10.3f} {:>12}'.format(
+                    mode, peak / 2 ** 20, elapsed, size))
+        finally:
+            db.session.remove()
+            db.drop_all()
+
+
+if __name__ == '__main__':
+    main()
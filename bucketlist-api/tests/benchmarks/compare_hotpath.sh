@@ -0,0 +1,23 @@
+#!/bin/sh
+# Runs the hot path benchmarks of the parent commit, the target branch on
+# pull request merge commits, and fails when this commit allocates more
+# or is slower. Both run on the same machine, so their speeds compare.
+# Only the parent is compared with, regressions spread over several
+# commits each within the tolerances pass
+
+set -e
+
+baseline=$(mktemp -d)
+results="$baseline.json"
+prefix=$(git rev-parse --show-prefix)
+git worktree add --detach "$baseline" HEAD^ > /dev/null
+trap 'git worktree remove --force "$baseline"; rm -f "$results"' EXIT
+
+if [ ! -f "$baseline/${prefix}tests/benchmarks/bench_hotpath.py" ]; then
+    echo "the parent commit has no hot path benchmarks to compare with"
+    exit 0
+fi
+
+(cd "$baseline/$prefix" &&
+    python -m tests.benchmarks.bench_hotpath --save "$results")
+python -m tests.benchmarks.bench_hotpath --compare "$results" "$@"
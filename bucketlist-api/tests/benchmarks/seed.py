@@ -0,0 +1,137 @@
+"""
+Module fills the database with synthetic users, bucketlists and items,
+on its own for a server to benchmark with
+
+    python -m tests.benchmarks.seed --users 100 --bucketlists 50 --items 10
+
+Seeding drops every table first, so configurations other than testing
+are refused unless --force is given
+"""
+import argparse
+import csv
+import datetime
+import io
+import itertools
+from app import create_app, db, password_hasher
+from app.models import User, Bucketlist, Item
+
+# configurations whose databases may be dropped without --force
+DISPOSABLE_CONFIGS = ('testing',)
+
+
+def chunks(rows, chunk_size):
+    """Yields lists of up to chunk_size rows"""
+    rows = iter(rows)
+    while True:
+        chunk = list(itertools.islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def insert_rows(table, rows, chunk_size=1000):
+    """Inserts rows with multi-row inserts of chunk_size rows"""
+    for chunk in chunks(rows, chunk_size):
+        db.session.execute(table.insert().values(chunk))
+
+
+def copy_rows(table, rows, chunk_size=10000):
+    """Loads rows with a PostgreSQL COPY of chunk_size rows at a time"""
+    cursor = db.session.connection().connection.cursor()
+    for chunk in chunks(rows, chunk_size):
+        columns = list(chunk[0])
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for row in chunk:
+            writer.writerow([row[column] for column in columns])
+        buffer.seek(0)
+        cursor.copy_expert(
+            'COPY {} ({}) FROM STDIN WITH CSV'.format(
+                table.name, ', '.join(columns)),
+            buffer)
+
+
+def write_rows(table, rows):
+    """Loads rows with COPY on PostgreSQL and multi-row inserts elsewhere"""
+    if db.engine.dialect.name == 'postgresql':
+        copy_rows(table, rows)
+    else:
+        insert_rows(table, rows)
+
+
+def seed(users, bucketlists, items, password='pass'):
+    """
+    Creates users each owning bucketlists with items each, all users
+    share password. Returns the ids of the users created
+    """
+    pw_hash = password_hasher.generate(password)
+    now = datetime.datetime.utcnow()
+    write_rows(User.__table__, (
+        {
+            'firstname': 'User',
+            'lastname': str(number),
+            'username': 'user{}'.format(number),
+            'password': pw_hash,
+            'email': 'user{}@example.com'.format(number)
+        }
+        for number in range(users)
+    ))
+    user_ids = [user_id for (user_id,) in db.session.query(User.id)]
+    write_rows(Bucketlist.__table__, (
+        {
+            'name': 'List {} of {}'.format(number, user_id),
+            'name_to_compare': 'list{}of{}'.format(number, user_id),
+            'description': 'Things to do, list {}'.format(number),
+            'owner': user_id,
+            'date_created': now,
+            'item_count': items,
+            'last_item_at': now if items else None
+        }
+        for user_id in user_ids for number in range(bucketlists)
+    ))
+    bucketlist_ids = [
+        bucketlist_id for (bucketlist_id,) in db.session.query(Bucketlist.id)]
+    write_rows(Item.__table__, (
+        {
+            'name': 'Item {} of {}'.format(number, bucketlist_id),
+            'name_to_compare': 'item{}of{}'.format(number, bucketlist_id),
+            'description': 'Something worth doing, item {}'.format(number),
+            'bucketlist_id': bucketlist_id
+        }
+        for bucketlist_id in bucketlist_ids for number in range(items)
+    ))
+    db.session.commit()
+    return user_ids
+
+
+def check_disposable(parser, args):
+    """Stops unless the database of args.config may be dropped"""
+    if args.config not in DISPOSABLE_CONFIGS and not args.force:
+        parser.error(
+            'seeding drops every table of the {} database, pass --force '
+            'to do it anyway'.format(args.config))
+
+
+def main():
+    """Recreates the tables of an app configuration and seeds them"""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--config', default='testing')
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--bucketlists', type=int, default=50)
+    parser.add_argument('--items', type=int, default=10)
+    parser.add_argument(
+        '--force', action='store_true',
+        help='drop the tables of a configuration other than testing')
+    args = parser.parse_args()
+    check_disposable(parser, args)
+
+    app = create_app(args.config)
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed(args.users, args.bucketlists, args.items)
+        db.session.remove()
+
+
+if __name__ == '__main__':
+    main()
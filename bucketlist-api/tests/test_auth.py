@@ -1,6 +1,12 @@
 """The module contains tests for the authentication service"""
+import datetime
 import json
 import time
+import bcrypt
+from sqlalchemy import event
+from app import db, token_cache
+from app.hashing import hash_rounds
+from app.models import BlacklistToken, User
 from .base import BaseTestCase
 
 
@@ -347,3 +353,144 @@ class TestAuth(BaseTestCase):
             self.assertEqual(response.status_code, 401)
             self.assertIn("Invalid token", data['message'])
             self.assertIn("Failed", data['status'])
+
+    def register_and_login(self):
+        """Helper method registers and logs in a user returning the token"""
+        self.client.post(
+            '/v1/auth/register',
+            data=json.dumps(dict(
+                firstname='inno',
+                lastname='asiimwe',
+                username='inno',
+                password='pass',
+                email='asiimwe@outlook.com'
+            )),
+            content_type='application/json'
+        )
+        res_login = self.client.post(
+            '/v1/auth/login',
+            data=json.dumps(dict(
+                username='inno',
+                password='pass'
+            )),
+            content_type='application/json'
+        )
+        return json.loads(res_login.data.decode())['auth_token']
+
+    def test_logged_out_token_rejected(self):
+        """Tests a token can not be used after logging out"""
+        with self.client:
+            auth_token = self.register_and_login()
+            res_logout = self.client.post(
+                '/v1/auth/logout',
+                headers=dict(Authorization='Bearer ' + auth_token)
+            )
+            response = self.client.get(
+                '/v1/bucketlists',
+                headers=dict(Authorization='Bearer ' + auth_token)
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(res_logout.status_code, 200)
+            self.assertEqual(response.status_code, 401)
+            self.assertIn('Invalid token', data['message'])
+
+    def test_valid_token_skips_blacklist_lookup(self):
+        """Tests a token that was never revoked is not looked up"""
+        with self.client:
+            auth_token = self.register_and_login()
+            self.client.get(
+                '/v1/bucketlists',
+                headers=dict(Authorization='Bearer ' + auth_token)
+            )
+            statements = []
+
+            def record(conn, cursor, statement, *args):
+                """Records every statement sent to the database"""
+                statements.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                response = self.client.get(
+                    '/v1/bucketlists',
+                    headers=dict(Authorization='Bearer ' + auth_token)
+                )
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(
+                [query for query in statements if 'blacklist_token' in query])
+
+    def test_purge_expired_blacklisted_tokens(self):
+        """Tests only expired tokens are purged from the blacklist"""
+        now = datetime.datetime.utcnow()
+        for number in range(3):
+            BlacklistToken(
+                jti='expired{}'.format(number),
+                expires_at=now - datetime.timedelta(hours=1)).save()
+        BlacklistToken(
+            jti='valid', expires_at=now + datetime.timedelta(hours=1)).save()
+        purged = BlacklistToken.purge_expired(batch_size=2)
+        self.assertEqual(3, purged)
+        self.assertEqual(
+            ['valid'], [token.jti for token in BlacklistToken.query.all()])
+
+    def test_verified_token_is_memoized(self):
+        """Tests a repeated token is served from the token cache"""
+        with self.client:
+            auth_token = self.register_and_login()
+            before = token_cache.stats()
+            for _ in range(3):
+                response = self.client.get(
+                    '/v1/bucketlists',
+                    headers=dict(Authorization='Bearer ' + auth_token)
+                )
+                self.assertEqual(response.status_code, 200)
+            after = token_cache.stats()
+            self.assertEqual(1, after['misses'] - before['misses'])
+            self.assertEqual(2, after['hits'] - before['hits'])
+
+    def test_login_busy_hashing_pool(self):
+        """Tests login is turned away with 503 while hashing is saturated"""
+        with self.client:
+            self.register_and_login()
+            state = self.app.extensions['password_hasher']
+            slots = state.pool_size + state.queue_limit
+            for _ in range(slots):
+                state.slots.acquire()
+            try:
+                response = self.client.post(
+                    '/v1/auth/login',
+                    data=json.dumps(dict(
+                        username='inno',
+                        password='pass'
+                    )),
+                    content_type='application/json'
+                )
+            finally:
+                for _ in range(slots):
+                    state.slots.release()
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 503)
+            self.assertTrue(response.headers.get('Retry-After'))
+            self.assertIn('Failed', data['status'])
+
+    def test_login_rehashes_password_with_other_cost(self):
+        """Tests a hash with another cost is replaced on login"""
+        with self.client:
+            self.register_and_login()
+            rounds = self.app.config['BCRYPT_LOG_ROUNDS']
+            user = User.query.filter_by(username='inno').first()
+            user.password = bcrypt.hashpw(
+                b'pass', bcrypt.gensalt(rounds + 1)).decode()
+            user.save()
+            response = self.client.post(
+                '/v1/auth/login',
+                data=json.dumps(dict(
+                    username='inno',
+                    password='pass'
+                )),
+                content_type='application/json'
+            )
+            user = User.query.filter_by(username='inno').first()
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(rounds, hash_rounds(user.password))
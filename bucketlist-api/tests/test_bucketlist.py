@@ -1,6 +1,10 @@
 """Module contains tests for the bucketlist service"""
+import gzip
 import json
-from app.models import User
+from sqlalchemy import event
+from app import db, renderer
+from app.models import User, Bucketlist, Item
+from app.renderers import orjson
 from .base import BaseTestCase
 
 
@@ -41,6 +45,41 @@ class TestBucketlist(BaseTestCase):
             )
         return response
 
+    def count_queries(self, url, access_token):
+        """Helper method returns the number of statements run by a GET"""
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            """Records every statement sent to the database"""
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', record)
+        try:
+            response = self.client.get(
+                url,
+                headers=dict(Authorization='Bearer ' + access_token),
+                content_type='application/json'
+            )
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', record)
+        self.assertEqual(response.status_code, 200)
+        return len(statements)
+
+    def create_bucketlists(self, owner, count, items=2):
+        """Helper method creates bucketlists with items directly in the db"""
+        start = Bucketlist.query.filter_by(owner=owner).count()
+        for number in range(start, start + count):
+            bucketlist = Bucketlist(
+                'list {} of {}'.format(number, owner),
+                'bucketlist number {}'.format(number),
+                owner)
+            bucketlist.save()
+            for item_number in range(items):
+                Item(
+                    'item {} of {}'.format(item_number, bucketlist.id),
+                    'item number {}'.format(item_number),
+                    bucketlist.id).save()
+
     def test_create_bucketlist_success(self):
         """Tests successful creation of bucketlist"""
 
@@ -823,4 +862,514 @@ class TestBucketlist(BaseTestCase):
             self.assertEqual(res_bucketlist3.status_code, 201)
             self.assertEqual(response.status_code, 200)
             self.assertEqual(2, len(data['items']))
-           
+
+    def test_get_bucketlists_query_count_is_constant(self):
+        """Tests listing bucketlists does not run a query per bucketlist"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            self.create_bucketlists(user_id, 2)
+            few_rows = self.count_queries('/v1/bucketlists', access_token)
+            few_rows_page = self.count_queries(
+                '/v1/bucketlists?page=1&limit=50', access_token)
+            self.create_bucketlists(user_id, 20)
+            many_rows = self.count_queries('/v1/bucketlists', access_token)
+            many_rows_page = self.count_queries(
+                '/v1/bucketlists?page=1&limit=50', access_token)
+            self.assertEqual(few_rows, many_rows)
+            self.assertEqual(few_rows_page, many_rows_page)
+
+    def test_cursor_pagination(self):
+        """Tests API can page through bucketlists with a cursor"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            self.create_bucketlists(user_id, 5, items=0)
+            names = []
+            url = '/v1/bucketlists?limit=2&cursor='
+            pages = 0
+            while url:
+                response = self.client.get(
+                    url,
+                    headers=dict(Authorization='Bearer ' + access_token),
+                    content_type='application/json'
+                )
+                data = json.loads(response.data.decode())
+                self.assertEqual(response.status_code, 200)
+                names.extend(item['name'] for item in data['items'])
+                pages += 1
+                url = None
+                if data['has_next']:
+                    url = '/v1/bucketlists?limit=2&cursor={}'.format(
+                        data['next_cursor'])
+            self.assertEqual(3, pages)
+            self.assertEqual(5, len(set(names)))
+
+    def test_cursor_pagination_invalid_cursor(self):
+        """Tests API returns 400 for a cursor it did not issue"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            response = self.client.get(
+                '/v1/bucketlists?cursor=not-a-cursor',
+                headers=dict(Authorization='Bearer ' + access_token),
+                content_type='application/json'
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('Invalid cursor', data['message'])
+
+    def test_invalid_limit(self):
+        """Tests API returns 400 for a limit that is not a page size"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            for limit in ('0', '-1', 'ten', '1000'):
+                response = self.client.get(
+                    '/v1/bucketlists?cursor=&limit=' + limit,
+                    headers=dict(Authorization='Bearer ' + access_token),
+                    content_type='application/json'
+                )
+                data = json.loads(response.data.decode())
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Invalid limit', data['message'])
+            response = self.client.get(
+                '/v1/bucketlists?page=1&limit=1000',
+                headers=dict(Authorization='Bearer ' + access_token),
+                content_type='application/json'
+            )
+            self.assertEqual(response.status_code, 200)
+
+    def test_search_treats_wildcards_literally(self):
+        """Tests searching for a wildcard does not match every bucketlist"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            Bucketlist('Tours', 'The tours of my life', user_id).save()
+            Bucketlist('Road trip', 'Across the country', user_id).save()
+            for query in ('%25', '_'):
+                response = self.client.get(
+                    '/v1/bucketlists?q=' + query,
+                    headers=dict(Authorization='Bearer ' + access_token),
+                    content_type='application/json'
+                )
+                data = json.loads(response.data.decode())
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual([], data)
+            Bucketlist('100% fun', 'Only fun things', user_id).save()
+            response = self.client.get(
+                '/v1/bucketlists?q=%25',
+                headers=dict(Authorization='Bearer ' + access_token),
+                content_type='application/json'
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(['100% fun'], [item['name'] for item in data])
+
+    def test_create_items_batch(self):
+        """Tests API can create many items reporting each row's result"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            bucketlist = Bucketlist('Before 30', 'Things to do', user_id)
+            bucketlist.save()
+            Item('Build a house', 'Build a rental house', bucketlist.id).save()
+            other = Bucketlist('Before 40', 'More things to do', user_id)
+            other.save()
+            Item('Learn French', 'In another list', other.id).save()
+            response = self.client.post(
+                '/v1/bucketlists/{}/items/batch'.format(bucketlist.id),
+                headers=dict(Authorization='Bearer ' + access_token),
+                data=json.dumps([
+                    dict(name='Visit Paris', description='See the tower'),
+                    dict(name='build a  House', description='Duplicate'),
+                    dict(name='Learn French', description='Before Paris'),
+                    dict(name='visit paris', description='Duplicate'),
+                    dict(description='No name')
+                ]),
+                content_type='application/json'
+            )
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 201)
+            self.assertEqual(2, data['created'])
+            self.assertEqual(
+                ['Success', 'Failed', 'Success', 'Failed', 'Failed'],
+                [result['status'] for result in data['items']])
+            self.assertEqual(
+                3, Item.query.filter_by(bucketlist_id=bucketlist.id).count())
+
+    def test_import_bucketlists(self):
+        """Tests API can import NDJSON reporting the lines that failed"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            other = User('Other', 'User', 'other', 'pass', 'o@o.com')
+            db.session.add(other)
+            db.session.commit()
+            Bucketlist('Tours', 'Their tours', other.id).save()
+            lines = [
+                json.dumps(dict(
+                    name='Before 30',
+                    description='Things to do before I am 30',
+                    items=[
+                        dict(name='Visit Paris', description='See it'),
+                        dict(name='Learn French', description='Speak it')
+                    ])),
+                '{not json',
+                json.dumps(dict(name='before  30', description='Again')),
+                json.dumps(dict(name='Tours', description='My tours'))
+            ]
+            response = self.client.post(
+                '/v1/bucketlists/import',
+                headers=dict(Authorization='Bearer ' + access_token),
+                data='\n'.join(lines),
+                content_type='application/x-ndjson'
+            )
+            events = [
+                json.loads(line)
+                for line in response.data.decode().splitlines()]
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [2, 3],
+                [event['line'] for event in events
+                 if event['status'] == 'Failed'])
+            self.assertEqual('Success', events[-1]['status'])
+            self.assertEqual(2, events[-1]['bucketlists'])
+            self.assertEqual(2, events[-1]['items'])
+            self.assertEqual(3, Bucketlist.query.count())
+
+    def test_import_rejects_lines_the_database_would_refuse(self):
+        """Tests lines too long or of the wrong type fail on their own"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            lines = [
+                json.dumps(dict(name='x' * 257, description='Too long')),
+                json.dumps(dict(name='Numbers', description=30)),
+                json.dumps(dict(
+                    name='Nul', description='Has a \x00 in it')),
+                json.dumps(dict(
+                    name='Bad items', description='Long item',
+                    items=[dict(name='y' * 257, description='Too long')])),
+                json.dumps(dict(
+                    name='Before 30', description='Things to do',
+                    items=[dict(name='Visit Paris', description=None)]))
+            ]
+            response = self.client.post(
+                '/v1/bucketlists/import',
+                headers=dict(Authorization='Bearer ' + access_token),
+                data='\n'.join(lines),
+                content_type='application/x-ndjson'
+            )
+            events = [
+                json.loads(line)
+                for line in response.data.decode().splitlines()]
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                [1, 2, 3, 4],
+                [event['line'] for event in events
+                 if event['status'] == 'Failed'])
+            self.assertEqual(1, events[-1]['bucketlists'])
+            self.assertEqual(1, events[-1]['items'])
+
+    def test_export_bucketlists(self):
+        """Tests API can export bucketlists as NDJSON and CSV"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            self.create_bucketlists(user_id, 2, items=3)
+            Bucketlist('Empty', 'No items yet', user_id).save()
+            res_ndjson = self.client.get(
+                '/v1/bucketlists/export?format=ndjson',
+                headers=dict(Authorization='Bearer ' + access_token)
+            )
+            res_csv = self.client.get(
+                '/v1/bucketlists/export?format=csv',
+                headers=dict(Authorization='Bearer ' + access_token)
+            )
+            res_unknown = self.client.get(
+                '/v1/bucketlists/export?format=xml',
+                headers=dict(Authorization='Bearer ' + access_token)
+            )
+            bucketlists = [
+                json.loads(line)
+                for line in res_ndjson.data.decode().splitlines()]
+            csv_lines = res_csv.data.decode().splitlines()
+            self.assertEqual(res_ndjson.status_code, 200)
+            self.assertEqual(
+                [3, 3, 0],
+                [len(bucketlist['items']) for bucketlist in bucketlists])
+            self.assertEqual(res_csv.status_code, 200)
+            self.assertTrue(csv_lines[0].startswith('bucketlist_id,'))
+            self.assertEqual(8, len(csv_lines))
+            self.assertEqual(res_unknown.status_code, 400)
+
+    def test_streamed_listing_matches_buffered_listing(self):
+        """Tests a streamed listing is the same JSON as a buffered one"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            self.create_bucketlists(user_id, 5, items=2)
+            self.app.config['STREAM_CHUNK_SIZE'] = 2
+            responses = [
+                self.client.get(
+                    '/v1/bucketlists?stream=' + stream,
+                    headers=dict(Authorization='Bearer ' + access_token)
+                )
+                for stream in ('false', 'true')
+            ]
+            buffered, streamed = [
+                json.loads(response.data.decode()) for response in responses]
+            self.assertEqual(responses[1].status_code, 200)
+            self.assertEqual(5, len(streamed))
+            self.assertEqual(buffered, streamed)
+            self.app.config['STREAM_ROW_THRESHOLD'] = 3
+            response = self.client.get(
+                '/v1/bucketlists',
+                headers=dict(Authorization='Bearer ' + access_token)
+            )
+            self.assertEqual(buffered, json.loads(response.data.decode()))
+
+    def test_conditional_get_bucketlist(self):
+        """Tests API answers 304 until an item of the bucketlist changes"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            bucketlist = Bucketlist('Before 30', 'Things to do', user_id)
+            bucketlist.save()
+            url = '/v1/bucketlists/{}'.format(bucketlist.id)
+            headers = dict(Authorization='Bearer ' + access_token)
+            response = self.client.get(url, headers=headers)
+            etag = response.headers['ETag']
+            res_cached = self.client.get(
+                url, headers=dict(headers, **{'If-None-Match': etag}))
+            res_listing = self.client.get('/v1/bucketlists', headers=headers)
+            self.client.post(
+                url + '/items',
+                headers=headers,
+                data=json.dumps(dict(
+                    name='Build a house',
+                    description='Build a rental house'
+                )),
+                content_type='application/json'
+            )
+            res_changed = self.client.get(
+                url, headers=dict(headers, **{'If-None-Match': etag}))
+            res_listing_changed = self.client.get(
+                '/v1/bucketlists',
+                headers=dict(headers, **{
+                    'If-None-Match': res_listing.headers['ETag']}))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(res_cached.status_code, 304)
+            self.assertFalse(res_cached.data)
+            self.assertEqual(res_changed.status_code, 200)
+            self.assertNotEqual(etag, res_changed.headers['ETag'])
+            self.assertEqual(1, len(json.loads(
+                res_changed.data.decode())['items']))
+            self.assertEqual(res_listing_changed.status_code, 200)
+
+    def test_compressed_listing(self):
+        """Tests listings are gzipped for clients accepting gzip"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            self.create_bucketlists(user_id, 10, items=2)
+            headers = dict(Authorization='Bearer ' + access_token)
+            plain = self.client.get('/v1/bucketlists', headers=headers)
+            responses = [
+                self.client.get(
+                    '/v1/bucketlists?stream=' + stream,
+                    headers=dict(headers, **{'Accept-Encoding': 'gzip'})
+                )
+                for stream in ('false', 'true')
+            ]
+            for response in responses:
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual('gzip', response.headers['Content-Encoding'])
+                self.assertIn('Accept-Encoding', response.headers['Vary'])
+                self.assertEqual(
+                    json.loads(plain.data.decode()),
+                    json.loads(gzip.decompress(response.data).decode()))
+            self.assertNotIn('Content-Encoding', plain.headers)
+
+    def test_orjson_renderer_matches_stdlib(self):
+        """Tests the orjson renderer returns the JSON of the stdlib one"""
+        if orjson is None:
+            self.skipTest('orjson is not installed')
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            self.create_bucketlists(user_id, 3, items=2)
+            headers = dict(Authorization='Bearer ' + access_token)
+            stdlib = self.client.get('/v1/bucketlists', headers=headers)
+            self.app.config['JSON_RENDERER'] = 'orjson'
+            renderer.init_app(self.app)
+            fast = self.client.get('/v1/bucketlists', headers=headers)
+            self.assertEqual(fast.status_code, 200)
+            self.assertEqual(
+                json.loads(stdlib.data.decode()),
+                json.loads(fast.data.decode()))
+
+    def test_query_count_headers(self):
+        """Tests the statements a request runs are reported in headers"""
+        self.app.config['SQL_PROFILING_HEADERS'] = True
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            self.create_bucketlists(user_id, 3, items=2)
+            # the first request also loads the revoked tokens
+            self.count_queries('/v1/bucketlists', access_token)
+            statements = self.count_queries('/v1/bucketlists', access_token)
+            response = self.client.get(
+                '/v1/bucketlists',
+                headers=dict(Authorization='Bearer ' + access_token)
+            )
+            self.assertEqual(
+                str(statements), response.headers['X-Query-Count'])
+            self.assertIn('db;dur=', response.headers['Server-Timing'])
+
+    def test_metrics_endpoint(self):
+        """Tests requests are exported as metrics labelled by endpoint"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            self.client.get(
+                '/v1/bucketlists',
+                headers=dict(Authorization='Bearer ' + access_token)
+            )
+            response = self.client.get('/metrics')
+            self.assertEqual(response.status_code, 403)
+            response = self.client.get(
+                '/metrics',
+                headers=dict(Authorization='Bearer scraper-token'))
+            metrics = response.data.decode()
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(
+                'http_requests_total{endpoint="bucketlist.get_bucketlists",'
+                'method="GET",status="200"}', metrics)
+            self.assertIn('http_request_duration_seconds_bucket', metrics)
+            self.assertIn('bcrypt_pending_hashes', metrics)
+            self.app.config['METRICS_ALLOWED_NETWORKS'] = ['10.0.0.0/8']
+            response = self.client.get(
+                '/metrics',
+                headers=dict(Authorization='Bearer scraper-token'))
+            self.assertEqual(response.status_code, 403)
+
+    def test_summary_listing_counts_items(self):
+        """Tests the summary listing follows items added and deleted"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            headers = dict(Authorization='Bearer ' + access_token)
+            response = self.client.post(
+                '/v1/bucketlists',
+                headers=headers,
+                data=json.dumps(dict(
+                    name='Before 30', description='Things to do')),
+                content_type='application/json'
+            )
+            b_id = json.loads(response.data.decode())['id']
+            for name in ('Visit Paris', 'Learn French'):
+                self.client.post(
+                    '/v1/bucketlists/{}/items'.format(b_id),
+                    headers=headers,
+                    data=json.dumps(dict(name=name, description='Soon')),
+                    content_type='application/json'
+                )
+            self.client.post(
+                '/v1/bucketlists/{}/items/batch'.format(b_id),
+                headers=headers,
+                data=json.dumps([
+                    dict(name='Skydive', description='Once'),
+                    dict(name='visit paris', description='Duplicate')
+                ]),
+                content_type='application/json'
+            )
+            item = Item.query.filter_by(bucketlist_id=b_id).first()
+            self.client.delete(
+                '/v1/bucketlists/{}/items/{}'.format(b_id, item.id),
+                headers=headers
+            )
+            response = self.client.get(
+                '/v1/bucketlists?view=summary', headers=headers)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(1, len(data))
+            self.assertEqual(
+                ['id', 'item_count', 'last_item_at', 'name'],
+                sorted(data[0]))
+            self.assertEqual(2, data[0]['item_count'])
+            self.assertIsNotNone(data[0]['last_item_at'])
+            self.assertEqual(
+                Item.query.filter_by(bucketlist_id=b_id).count(),
+                data[0]['item_count'])
+            for unsupported in ('q=Before', 'fields=id'):
+                response = self.client.get(
+                    '/v1/bucketlists?view=summary&' + unsupported,
+                    headers=headers)
+                self.assertEqual(response.status_code, 400)
+
+    def test_sparse_fieldsets(self):
+        """Tests only the fields asked for are read and returned"""
+        with self.client:
+            self.register_user()
+            res_login = self.login_user()
+            user_id = User.query.filter_by(username='inno').first().id
+            access_token = json.loads(res_login.data.decode())['auth_token']
+            headers = dict(Authorization='Bearer ' + access_token)
+            self.create_bucketlists(user_id, 2)
+            statements = []
+
+            def record(conn, cursor, statement, *args):
+                """Records every statement sent to the database"""
+                statements.append(statement)
+
+            event.listen(db.engine, 'before_cursor_execute', record)
+            try:
+                response = self.client.get(
+                    '/v1/bucketlists?fields=name,id', headers=headers)
+            finally:
+                event.remove(db.engine, 'before_cursor_execute', record)
+            data = json.loads(response.data.decode())
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(['id', 'name'], sorted(data[0]))
+            self.assertFalse([
+                statement for statement in statements
+                if 'FROM items' in statement or 'description' in statement])
+            response = self.client.get(
+                '/v1/bucketlists/{}?fields=id,items&items_fields=name'.format(
+                    data[0]['id']),
+                headers=headers)
+            bucketlist = json.loads(response.data.decode())
+            self.assertEqual(['id', 'items'], sorted(bucketlist))
+            self.assertEqual(2, len(bucketlist['items']))
+            for item in bucketlist['items'].values():
+                self.assertEqual(['name'], list(item))
+            response = self.client.get(
+                '/v1/bucketlists?fields=id,secret', headers=headers)
+            self.assertEqual(response.status_code, 400)
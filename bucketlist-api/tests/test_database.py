@@ -0,0 +1,119 @@
+"""Module contains tests for the database engine configuration"""
+import json
+from sqlalchemy import event
+from sqlalchemy.exc import ProgrammingError
+from app import db
+from app.database import TimedQueuePool, pool_sizing
+from app.models import User, Bucketlist, Item
+from app.routing import _ReplicaState
+from .base import BaseTestCase
+
+
+class TestDatabase(BaseTestCase):
+    """class contains tests for the engine and its connection pool"""
+
+    @staticmethod
+    def plan(query):
+        """
+        Returns the query plan of a query, with sequential scans disabled
+        so the tiny test tables are read through an index when one fits
+        """
+        db.session.execute('SET LOCAL enable_seqscan = off')
+        statement = query.statement.compile(
+            dialect=db.engine.dialect, compile_kwargs={'literal_binds': True})
+        return '\n'.join(
+            row[0] for row in db.session.execute('EXPLAIN ' + str(statement)))
+
+    def test_pool_sizing(self):
+        """Tests the pool follows the threads within the connection limit"""
+        self.assertEqual((4, 4), pool_sizing(4, workers=2))
+        self.assertEqual((4, 1), pool_sizing(4, workers=2, max_connections=10))
+        self.assertEqual((1, 0), pool_sizing(8, workers=4, max_connections=2))
+
+    def test_pool_measures_checkouts(self):
+        """Tests the pool of the app records the waits of its checkouts"""
+        User.query.count()
+        stats = db.pool_stats()
+        self.assertIsInstance(db.engine.pool, TimedQueuePool)
+        self.assertEqual('TimedQueuePool', stats['pool'])
+        self.assertGreaterEqual(stats['checkouts'], 1)
+        self.assertGreaterEqual(stats['wait_max'], 0)
+
+    def test_failed_statement_leaves_no_timing(self):
+        """Tests a statement that fails is not left timing on the profile"""
+        with self.assertRaises(ProgrammingError):
+            with db.session.begin_nested():
+                db.session.execute('SELECT * FROM no_such_table')
+        self.assertFalse(
+            db.session.connection().info.get('profiling_started'))
+
+    def test_reads_go_to_replica_until_user_writes(self):
+        """Tests GETs read from the replica except right after a write"""
+        state = _ReplicaState(self.app, [db.make_engine(
+            self.app, self.app.config['SQLALCHEMY_DATABASE_URI'])])
+        self.app.extensions['replica_router'] = state
+        replica = state.replicas[0]
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            """Records every statement sent to the replica"""
+            statements.append(statement)
+
+        event.listen(replica.engine, 'before_cursor_execute', record)
+        with self.client:
+            self.client.post(
+                '/v1/auth/register',
+                data=json.dumps(dict(
+                    firstname='inno',
+                    lastname='asiimwe',
+                    username='inno',
+                    password='pass',
+                    email='asiimwe@outlook.com'
+                )),
+                content_type='application/json'
+            )
+            res_login = self.client.post(
+                '/v1/auth/login',
+                data=json.dumps(dict(username='inno', password='pass')),
+                content_type='application/json'
+            )
+            headers = dict(Authorization='Bearer ' + json.loads(
+                res_login.data.decode())['auth_token'])
+            self.assertFalse(statements)
+            self.client.get('/v1/bucketlists', headers=headers)
+            replica_reads = len(statements)
+            self.client.post(
+                '/v1/bucketlists',
+                headers=headers,
+                data=json.dumps(dict(
+                    name='Before 30', description='Things to do')),
+                content_type='application/json'
+            )
+            response = self.client.get('/v1/bucketlists', headers=headers)
+            self.assertGreater(replica_reads, 0)
+            self.assertEqual(replica_reads, len(statements))
+            self.assertEqual(1, len(json.loads(response.data.decode())))
+        event.remove(replica.engine, 'before_cursor_execute', record)
+        replica.engine.dispose()
+
+    def test_lookups_use_composite_indexes(self):
+        """Tests the listings and duplicate checks are index scans"""
+        self.assertIn('ix_bucketlists_owner_name_to_compare', self.plan(
+            Bucketlist.query.filter_by(name_to_compare='before30', owner=1)))
+        self.assertIn('ix_items_bucketlist_id_name_to_compare', self.plan(
+            Item.query.filter_by(name_to_compare='skydive', bucketlist_id=1)))
+        self.assertIn('ix_bucketlists_owner_id', self.plan(
+            Bucketlist.query.filter_by(owner=1).order_by(Bucketlist.id)))
+        self.assertIn('ix_items_bucketlist_id_id', self.plan(
+            Item.get_all_items(1)))
+        self.assertIn('ix_bucketlists_owner_id', self.plan(
+            Bucketlist.get_summaries(1)))
+
+    def test_touched_columns_are_not_indexed(self):
+        """Tests item changes update no indexed bucketlist column"""
+        indexed = {
+            column.name
+            for index in Bucketlist.__table__.indexes
+            for column in index.columns}
+        self.assertFalse(indexed.intersection(
+            ('version', 'date_modified', 'item_count', 'last_item_at')))